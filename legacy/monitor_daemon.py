@@ -4,6 +4,9 @@ NCCU 機房監控系統 - 優化版本
 效能改進、記憶體優化、更好的錯誤處理
 """
 
+import array
+import atexit
+import math
 import os
 import sys
 import time
@@ -12,10 +15,9 @@ import logging
 import traceback
 import threading
 import queue
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
-from contextlib import contextmanager
+from logging.handlers import MemoryHandler, RotatingFileHandler
 
 # 確保在正確的目錄下運行
 SCRIPT_DIR = Path(__file__).parent
@@ -36,22 +38,56 @@ file_handler = RotatingFileHandler(
 )
 file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 
-# 控制台處理器
+# 記憶體緩衝處理器 - 批次寫入一般訊息，WARNING 以上（火焰/煙霧警報）立即寫入
+memory_handler = MemoryHandler(
+    capacity=200,
+    flushLevel=logging.WARNING,
+    target=file_handler,
+    flushOnClose=True
+)
+atexit.register(memory_handler.flush)
+
+# 控制台處理器 - 僅在互動終端機執行時啟用，背景服務只寫入輪替日誌檔
 console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+logger.addHandler(memory_handler)
+if sys.stdout.isatty():
+    logger.addHandler(console_handler)
 
 # 全域變數
 running = True
 restart_count = 0
 max_restarts = 10
 
+# GPIO 設定 - 透過 chardev (/dev/gpiochip0) 而非 sysfs 取得邊緣中斷
+GPIO_CHIP = "/dev/gpiochip0"
+SMOKE_PIN = 17  # MQ-2 煙霧感測器 (低電位觸發)
+FLAME_PIN = 27  # 火焰感測器 (低電位觸發)
+
+# 警報郵件範本 - 只在發送時填入事件類型、時間與影像數
+ALERT_SUBJECT = "🚨【緊急警報】NCCU 大仁樓 1F 機房偵測到 {event_type} - {time}"
+ALERT_BODY = """🚨 NCCU 政治大學機房監控系統 - 緊急警報通知 🚨
+
+偵測位置：NCCU 大仁樓 1F（樓梯旁）機房
+事件類型：{event_type} 
+偵測時間：{time}
+附件影像：{count} 張
+
+請立即前往現場查看！
+
+緊急聯絡人：李恩甫同學 (0958-242-580)
+
+NCCU 機房監控系統"""
+
+# 攝影機解析度 - ROI 座標以此解析度為準
+CAMERA_RESOLUTION = (640, 480)
+
 def signal_handler(signum, frame):
     """處理系統信號，優雅關閉"""
     global running
     logger.info(f"收到信號 {signum}，準備關閉系統...")
+    memory_handler.flush()
     running = False
 
 def import_monitor_modules():
@@ -62,22 +98,22 @@ def import_monitor_modules():
         import smtplib
         from collections import deque
         from email.mime.multipart import MIMEMultipart
-        from email.mime.base import MIMEBase
+        from email.mime.application import MIMEApplication
         from email.mime.text import MIMEText
-        from email import encoders
         from picamera import PiCamera
-        from PIL import Image
-        import board
-        import digitalio
+        from turbojpeg import TurboJPEG, TJPF_RGB
+        import gpiod
+        from gpiod.line import Bias, Direction, Edge, Value
         from dotenv import load_dotenv
         import numpy as np
         
         return {
             'io': io, 'zipfile': zipfile, 'smtplib': smtplib,
             'deque': deque, 'MIMEMultipart': MIMEMultipart,
-            'MIMEBase': MIMEBase, 'MIMEText': MIMEText,
-            'encoders': encoders, 'PiCamera': PiCamera,
-            'Image': Image, 'board': board, 'digitalio': digitalio,
+            'MIMEApplication': MIMEApplication, 'MIMEText': MIMEText,
+            'PiCamera': PiCamera,
+            'TurboJPEG': TurboJPEG, 'TJPF_RGB': TJPF_RGB, 'gpiod': gpiod, 'Bias': Bias,
+            'Direction': Direction, 'Edge': Edge, 'Value': Value,
             'load_dotenv': load_dotenv, 'np': np
         }
     except ImportError as e:
@@ -88,20 +124,68 @@ def import_monitor_modules():
         logger.error(f"未預期的錯誤: {e}")
         return None
 
+class FramePool:
+    """預先配置的 ROI 影格池 - 循環重複使用，避免每幀配置記憶體
+    
+    取得的槽位即被釘選 (refcount > 0)，直到影格被略過或移出緩衝區才釋放；
+    事件保存期間另外加釘，循環時跳過所有被釘選的槽位。
+    """
+    
+    def __init__(self, np, shape, size):
+        self.slots = [np.empty(shape, dtype=np.uint8) for _ in range(size)]
+        self.refcounts = array.array('i', [0] * size)
+        self.next_index = 0
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """取得並釘選下一個可覆寫的影格槽位，全部被釘選時回傳 None"""
+        size = len(self.slots)
+        with self.lock:
+            for _ in range(size):
+                index = self.next_index
+                self.next_index = (index + 1) % size
+                if self.refcounts[index] == 0:
+                    self.refcounts[index] = 1
+                    return index, self.slots[index]
+        return None
+    
+    def pin(self, indexes):
+        """釘選影格，避免在使用中被覆寫"""
+        with self.lock:
+            for index in indexes:
+                self.refcounts[index] += 1
+    
+    def release(self, indexes):
+        """解除釘選"""
+        with self.lock:
+            for index in indexes:
+                self.refcounts[index] -= 1
+
 class MonitorSystem:
     """監控系統核心類別 - 優化版"""
     
     def __init__(self):
         self.modules = None
         self.camera = None
-        self.mq2 = None
-        self.flame = None
+        self.gpio_request = None
+        self.gpio_events = queue.Queue()
+        self.gpio_thread = None
+        self.gpio_stop = threading.Event()
+        self.sensor_active = {SMOKE_PIN: False, FLAME_PIN: False}
         self.buffer = None
+        self.frame_buf = None
+        self.frame_pool = None
+        self._diff_buf = None
+        self._prev_roi = None
+        self.jpeg = None
+        self.frame_queue = queue.Queue(maxsize=2)  # 擷取與感測迴圈間的背壓佇列
+        self.capture_thread = None
+        self.capture_stop = threading.Event()
         self.smtp_config = {}
         self.fire_count = 0
         self.smoke_count = 0  # 新增煙霧計數器
-        self.fire_threshold = 3
-        self.smoke_threshold = 2  # 煙霧需要 2 次偵測
+        self.fire_threshold = 3  # 依 FIRE_CONFIRM_SECONDS / SENSOR_INTERVAL 換算
+        self.smoke_threshold = 2  # 依 SMOKE_CONFIRM_SECONDS / SENSOR_INTERVAL 換算
         self.last_fire_alert = None
         self.last_smoke_alert = None
         self.alert_cooldown = 300
@@ -109,20 +193,19 @@ class MonitorSystem:
         # 效能優化：使用執行緒池處理郵件發送
         self.alert_queue = None
         self.alert_thread = None
+        self.alert_batch_window = 2  # 合併同時發生的警報，共用一次 SMTP 連線的最長等待（秒）
+        self.alert_batch_quiet = 0.2  # 佇列靜止超過此時間即停止等待（秒）
         
-        # 記憶體優化：限制同時保存的影像檔案數量
-        self.max_saved_images = 100
-        self.saved_image_count = 0
+        # 持續連線的 SMTP 工作階段，僅由警報執行緒使用
+        self.smtp = None
+        self.smtp_last_used = 0
+        self.smtp_keepalive = 60  # 閒置時每 60 秒送出 NOOP
+        self.smtp_idle_timeout = 300  # 閒置 5 分鐘後關閉連線
+        
+        # 定期清理舊檔案，不佔用事件保存路徑
+        self.cleanup_interval = 3600  # 每小時一次
+        self.cleanup_timer = None
         
-    @contextmanager
-    def camera_capture(self):
-        """使用 context manager 確保資源正確釋放"""
-        stream = self.modules['io'].BytesIO()
-        try:
-            yield stream
-        finally:
-            stream.close()
-            
     def initialize(self):
         """初始化系統 - 加入更多錯誤檢查"""
         try:
@@ -130,6 +213,9 @@ class MonitorSystem:
             self.modules = import_monitor_modules()
             if not self.modules:
                 return False
+            
+            # 將常用的模組成員綁定為屬性，避免在事件處理路徑上重複查詢字典
+            self._bind_modules()
                 
             # 載入環境變數
             self.modules['load_dotenv']()
@@ -149,10 +235,21 @@ class MonitorSystem:
                 'PASS': os.getenv("SMTP_PASS", ""),
                 'ALERT_TO': os.getenv("ALERT_TO", "")
             }
+            self.mail_from = self.smtp_config['USER']
+            self.mail_to = self.smtp_config['ALERT_TO']
             
             # 監控參數 - 可從環境變數設定
             self.BUFFER_SIZE = int(os.getenv("BUFFER_SIZE", 20))
             self.CAP_INTERVAL = int(os.getenv("CAP_INTERVAL", 5))
+            self.SENSOR_INTERVAL = float(os.getenv("SENSOR_INTERVAL", 1))
+            
+            # 確認時間以秒為單位，換算成連續偵測次數，調整取樣間隔時不改變防抖時間
+            self.FIRE_CONFIRM_SECONDS = float(os.getenv("FIRE_CONFIRM_SECONDS", 15))
+            self.SMOKE_CONFIRM_SECONDS = float(os.getenv("SMOKE_CONFIRM_SECONDS", 10))
+            self.fire_threshold = max(1, math.ceil(self.FIRE_CONFIRM_SECONDS / self.SENSOR_INTERVAL))
+            self.smoke_threshold = max(1, math.ceil(self.SMOKE_CONFIRM_SECONDS / self.SENSOR_INTERVAL))
+            self.alert_batch_window = float(os.getenv("ALERT_BATCH_WINDOW", self.alert_batch_window))
+            self.MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", 2.0))  # 每像素平均差異，0 表示停用
             self.ROI = tuple(map(int, os.getenv("ROI", "100,80,200,150").split(",")))
             self.OUT_DIR = os.getenv("OUT_DIR", "captures")
             
@@ -161,33 +258,59 @@ class MonitorSystem:
             
             # 清理舊檔案（保留最近 7 天）
             self._cleanup_old_files()
+            self._schedule_cleanup()
             
-            # 初始化感測器
-            board = self.modules['board']
-            digitalio = self.modules['digitalio']
-            
-            self.mq2 = digitalio.DigitalInOut(board.D17)
-            self.mq2.direction = digitalio.Direction.INPUT
-            
-            self.flame = digitalio.DigitalInOut(board.D27)
-            self.flame.direction = digitalio.Direction.INPUT
+            # 初始化感測器 - 以核心邊緣中斷取代輪詢
+            self._init_gpio_events()
             
             # 初始化攝影機 - 使用較低解析度以節省記憶體
             self.camera = self.modules['PiCamera']()
-            self.camera.resolution = (640, 480)
+            self.camera.resolution = CAMERA_RESOLUTION
+            
+            # 由 ISP 直接裁切 ROI，擷取時只傳輸 ROI 大小的影像
+            x, y, roi_w, roi_h = self.ROI
+            width, height = CAMERA_RESOLUTION
+            self.camera.zoom = (x / width, y / height, roi_w / width, roi_h / height)
+            
             self.camera.start_preview()
             time.sleep(2)  # 等待攝影機穩定
             
+            # 預先配置 RGB 影格緩衝區，每次擷取重複使用
+            # 未編碼擷取的寬會補齊至 32 的倍數、高補齊至 16 的倍數
+            padded_w = (roi_w + 31) // 32 * 32
+            padded_h = (roi_h + 15) // 16 * 16
+            self.frame_buf = self.np.empty((padded_h, padded_w, 3), dtype=self.np.uint8)
+            
+            # ROI 影格池：緩衝區 + 佇列中 + 擷取中的影格，另保留餘裕
+            # 緩衝區中的影格會一直釘選到被移出，靜止畫面下也不會被覆寫
+            self.frame_pool = FramePool(self.np, (roi_h, roi_w, 3), self.BUFFER_SIZE + 4)
+            
+            # 畫面變化判斷共用的差值緩衝區與上一張緩衝影格，避免每張影格重新配置
+            self._diff_buf = self.np.empty((roi_h, roi_w, 3), dtype=self.np.int16)
+            self._prev_roi = self.np.zeros((roi_h, roi_w, 3), dtype=self.np.uint8)
+            
+            # libjpeg-turbo 編碼器 (NEON SIMD)，取代 PIL 的 JPEG 編碼
+            self.jpeg = self.modules['TurboJPEG']()
+            
             # 初始化緩衝區
             self.buffer = self.modules['deque'](maxlen=self.BUFFER_SIZE)
             
+            # 啟動影像擷取執行緒，與感測器取樣分離
+            self.capture_stop.clear()
+            self.capture_thread = threading.Thread(target=self._capture_worker, daemon=True)
+            self.capture_thread.start()
+            
             # 初始化警報佇列和執行緒
             self.alert_queue = queue.Queue()
             self.alert_thread = threading.Thread(target=self._alert_worker, daemon=True)
             self.alert_thread.start()
             
             logger.info("系統初始化完成")
-            logger.info(f"監控參數: BUFFER_SIZE={self.BUFFER_SIZE}, CAP_INTERVAL={self.CAP_INTERVAL}, ROI={self.ROI}")
+            logger.info(f"監控參數: BUFFER_SIZE={self.BUFFER_SIZE}, CAP_INTERVAL={self.CAP_INTERVAL}, "
+                        f"SENSOR_INTERVAL={self.SENSOR_INTERVAL}, ROI={self.ROI}, "
+                        f"MOTION_THRESHOLD={self.MOTION_THRESHOLD}, "
+                        f"FIRE_CONFIRM={self.FIRE_CONFIRM_SECONDS}s ({self.fire_threshold} 次), "
+                        f"SMOKE_CONFIRM={self.SMOKE_CONFIRM_SECONDS}s ({self.smoke_threshold} 次)")
             return True
             
         except Exception as e:
@@ -195,116 +318,356 @@ class MonitorSystem:
             logger.error(traceback.format_exc())
             return False
     
+    def _bind_modules(self):
+        """將事件保存與郵件發送使用的模組成員綁定為實例屬性"""
+        m = self.modules
+        self.np = m['np']
+        self.ZipFile = m['zipfile'].ZipFile
+        self.ZIP_STORED = m['zipfile'].ZIP_STORED
+        self.TJPF_RGB = m['TJPF_RGB']
+        self.MIMEMultipart = m['MIMEMultipart']
+        self.MIMEText = m['MIMEText']
+        self.MIMEApplication = m['MIMEApplication']
+        self.SMTP = m['smtplib'].SMTP
+    
+    def _init_gpio_events(self):
+        """向核心請求 GPIO 邊緣事件，並啟動事件監聽執行緒"""
+        gpiod = self.modules['gpiod']
+        settings = gpiod.LineSettings(
+            direction=self.modules['Direction'].INPUT,
+            edge_detection=self.modules['Edge'].BOTH,
+            bias=self.modules['Bias'].PULL_UP
+        )
+        self.gpio_request = gpiod.request_lines(
+            GPIO_CHIP,
+            consumer="nccu-monitor",
+            config={(SMOKE_PIN, FLAME_PIN): settings}
+        )
+        
+        # 以目前電位作為初始狀態（低電位 = 觸發）
+        inactive = self.modules['Value'].INACTIVE
+        for pin in (SMOKE_PIN, FLAME_PIN):
+            self.sensor_active[pin] = self.gpio_request.get_value(pin) == inactive
+        
+        self.gpio_stop.clear()
+        self.gpio_thread = threading.Thread(target=self._gpio_event_worker, daemon=True)
+        self.gpio_thread.start()
+    
+    def _gpio_event_worker(self):
+        """背景執行緒等待 GPIO 邊緣事件 (epoll)，轉送至事件佇列"""
+        rising = self.modules['gpiod'].EdgeEvent.Type.RISING_EDGE
+        while not self.gpio_stop.is_set():
+            try:
+                if not self.gpio_request.wait_edge_events(timedelta(seconds=1)):
+                    continue
+                for event in self.gpio_request.read_edge_events():
+                    level = 1 if event.event_type == rising else 0
+                    self.gpio_events.put((event.line_offset, level, event.timestamp_ns))
+            except Exception as e:
+                if not self.gpio_stop.is_set():
+                    logger.error(f"GPIO 事件處理錯誤: {e}")
+                    time.sleep(1)
+    
+    def _read_sensors(self):
+        """取出累積的 GPIO 事件，回傳 (smoke, fire)
+        
+        感測器在本次迭代期間曾被觸發（即使脈衝已結束）也視為偵測到。
+        """
+        triggered = {SMOKE_PIN: False, FLAME_PIN: False}
+        while True:
+            try:
+                pin, level, _ = self.gpio_events.get_nowait()
+            except queue.Empty:
+                break
+            self.sensor_active[pin] = level == 0
+            if level == 0:
+                triggered[pin] = True
+        
+        smoke = triggered[SMOKE_PIN] or self.sensor_active[SMOKE_PIN]
+        fire = triggered[FLAME_PIN] or self.sensor_active[FLAME_PIN]
+        return smoke, fire
+    
     def _cleanup_old_files(self):
         """清理舊的監控檔案"""
         try:
-            import glob
-            from datetime import timedelta
-            
             cutoff_time = time.time() - (7 * 24 * 60 * 60)  # 7 天前
             
-            for pattern in ["*.jpg", "*.zip"]:
-                for filepath in glob.glob(os.path.join(self.OUT_DIR, pattern)):
-                    if os.path.getmtime(filepath) < cutoff_time:
-                        os.remove(filepath)
-                        logger.info(f"已刪除舊檔案: {filepath}")
+            # 單次走訪目錄，先以檔名過濾再 stat
+            with os.scandir(self.OUT_DIR) as it:
+                for e in it:
+                    if (e.name.endswith((".jpg", ".zip", ".zip.tmp"))
+                            and e.is_file() and e.stat().st_mtime < cutoff_time):
+                        os.remove(e.path)
+                        logger.info(f"已刪除舊檔案: {e.path}")
                         
         except Exception as e:
             logger.warning(f"清理舊檔案時發生錯誤: {e}")
     
+    def _schedule_cleanup(self):
+        """排程下一次定期清理"""
+        self.cleanup_timer = threading.Timer(self.cleanup_interval, self._periodic_cleanup)
+        self.cleanup_timer.daemon = True
+        self.cleanup_timer.start()
+    
+    def _periodic_cleanup(self):
+        """定期清理舊檔案並重新排程"""
+        self._cleanup_old_files()
+        if running:
+            self._schedule_cleanup()
+    
     def capture_roi(self):
         """擷取 ROI 區域影像 - 優化記憶體使用"""
         try:
-            with self.camera_capture() as stream:
-                self.camera.capture(stream, format='jpeg', use_video_port=True)  # 使用 video port 加速
-                stream.seek(0)
-                
-                # 只在需要時載入完整影像
-                img = self.modules['Image'].open(stream)
-                
-                # 直接裁切 ROI 區域，避免載入整張影像到 numpy
-                x, y, w, h = self.ROI
-                roi_img = img.crop((x, y, x+w, y+h))
-                
-                # 轉換為 numpy array
-                return self.modules['np'].array(roi_img)
-                
+            # 直接擷取 ROI 大小的 RGB 到預先配置的影格緩衝區，省去 JPEG 編碼與解碼
+            _, _, w, h = self.ROI
+            self.camera.capture(self.frame_buf, 'rgb', resize=(w, h), use_video_port=True)  # 使用 video port 加速
+            
+            # 將 ROI 複製到影格池的槽位，避免下一次擷取覆寫緩衝區中的記錄
+            slot = self.frame_pool.acquire()
+            if slot is None:
+                logger.warning("影格池已滿，略過此次擷取")
+                return None
+            index, roi = slot
+            roi[...] = self.frame_buf[:h, :w]
+            return index, roi
+            
         except Exception as e:
             logger.error(f"影像擷取失敗: {e}")
             return None
     
+    def _capture_worker(self):
+        """背景執行緒依 CAP_INTERVAL 擷取影像，送入影格佇列"""
+        next_deadline = time.monotonic()
+        last_sec = 0
+        ts = ""
+        while not self.capture_stop.is_set():
+            # 時間戳記只到秒，同一秒內重複使用已格式化的字串
+            now = int(time.time())
+            if now != last_sec:
+                ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+                last_sec = now
+            frame = self.capture_roi()
+            if frame is None:
+                self.capture_stop.wait(1)
+                continue
+            
+            # 佇列已滿時阻塞等待，避免感測迴圈忙碌時記憶體無限成長
+            while not self.capture_stop.is_set():
+                try:
+                    self.frame_queue.put((ts, frame), timeout=1)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                self.frame_pool.release((frame[0],))
+            
+            next_deadline = self._wait_until_next(next_deadline, self.CAP_INTERVAL, self.capture_stop.wait)
+    
+    @staticmethod
+    def _wait_until_next(deadline, interval, sleep):
+        """以絕對期限排程下一次執行，避免誤差逐次累積
+        
+        落後超過一個間隔時（例如事件保存耗時較久）從現在重新起算，避免連續追趕。
+        
+        Returns:
+            下一次的期限
+        """
+        deadline += interval
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            sleep(remaining)
+            return deadline
+        return time.monotonic()
+    
+    def _drain_frames(self, smoke, fire):
+        """將擷取執行緒產生的影格加入緩衝區
+        
+        無感測器事件時，與上一張影格幾乎相同的畫面不會加入緩衝區，
+        讓警報時的影像記錄保留最近有變化的畫面。
+        略過的影格立即釋放槽位；加入緩衝區的影格維持釘選，直到被移出緩衝區。
+        
+        Returns:
+            本次收取的影格數
+        """
+        count = 0
+        while True:
+            try:
+                ts, (slot, roi) = self.frame_queue.get_nowait()
+            except queue.Empty:
+                return count
+            count += 1
+            if not (smoke or fire or self.fire_count or self.smoke_count) and not self._roi_changed(roi):
+                self.frame_pool.release((slot,))
+                continue
+            if len(self.buffer) == self.buffer.maxlen:
+                self.frame_pool.release((self.buffer[0]["slot"],))
+            self.buffer.append({"ts": ts, "img": roi, "slot": slot, "smoke": smoke, "fire": fire})
+            self._prev_roi[...] = roi
+    
+    def _roi_changed(self, roi):
+        """比較 ROI 與緩衝區中最新的影格，判斷畫面是否有變化"""
+        if self.MOTION_THRESHOLD <= 0 or not self.buffer:
+            return True
+        
+        np = self.np
+        diff = self._diff_buf
+        np.subtract(roi, self._prev_roi, out=diff, dtype=np.int16)
+        np.abs(diff, out=diff)
+        return int(diff.sum()) / diff.size >= self.MOTION_THRESHOLD
+    
     def _alert_worker(self):
         """背景執行緒處理警報發送"""
         while True:
             try:
-                alert_data = self.alert_queue.get()
+                try:
+                    alert_data = self.alert_queue.get(timeout=self.smtp_keepalive)
+                except queue.Empty:
+                    self._smtp_keepalive()
+                    continue
+                
                 if alert_data is None:  # 停止信號
                     break
-                    
-                self._send_alert_internal(alert_data['event_type'], 
-                                        alert_data['zip_bytes'], 
-                                        alert_data['entries'])
+                
+                # 讓同時發生的警報（例如煙霧與火焰）一併取出，佇列靜止後立即發送
+                batch, stop = self._drain_alert_queue(alert_data)
+                
+                self._send_alert_batch(batch)
+                
+                if stop:
+                    break
                                         
             except Exception as e:
                 logger.error(f"警報處理錯誤: {e}")
+        
+        self._close_smtp()
+    
+    def _ensure_smtp(self):
+        """取得已登入的 SMTP 連線，必要時重新建立"""
+        if self.smtp is not None:
+            try:
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except Exception:
+                pass
+            self._close_smtp()
+        
+        server = self.SMTP(self.smtp_config['HOST'], self.smtp_config['PORT'], timeout=30)
+        try:
+            server.starttls()
+            server.login(self.smtp_config['USER'], self.smtp_config['PASS'])
+        except Exception:
+            server.close()
+            raise
+        self.smtp = server
+        return server
+    
+    def _smtp_keepalive(self):
+        """閒置期間維持 SMTP 連線，超過閒置時限則關閉"""
+        if self.smtp is None:
+            return
+        if time.monotonic() - self.smtp_last_used >= self.smtp_idle_timeout:
+            self._close_smtp()
+            return
+        try:
+            if self.smtp.noop()[0] != 250:
+                self._close_smtp()
+        except Exception:
+            self._close_smtp()
+    
+    def _close_smtp(self):
+        """關閉 SMTP 連線"""
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+        self.smtp = None
+    
+    def _drain_alert_queue(self, first):
+        """取出佇列中所有待發送的警報
+        
+        持續等待後續警報，直到佇列靜止 alert_batch_quiet 秒或超過 alert_batch_window。
+        
+        Returns:
+            (警報列表, 是否收到停止信號)
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.alert_batch_window
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    alert_data = self.alert_queue.get(timeout=min(self.alert_batch_quiet, remaining))
+                else:
+                    alert_data = self.alert_queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+            if alert_data is None:
+                return batch, True
+            batch.append(alert_data)
     
-    def send_alert(self, event_type, zip_bytes, entries):
-        """將警報加入佇列（非阻塞）"""
+    def send_alert(self, event_type, zip_path, entries):
+        """將警報加入佇列（非阻塞），只傳遞磁碟上的 ZIP 路徑"""
         try:
             self.alert_queue.put({
                 'event_type': event_type,
-                'zip_bytes': zip_bytes,
+                'zip_path': zip_path,
                 'entries': entries
             })
         except Exception as e:
             logger.error(f"加入警報佇列失敗: {e}")
     
-    def _send_alert_internal(self, event_type, zip_bytes, entries):
-        """實際發送警報郵件"""
+    def _build_alert_message(self, event_type, zip_path, entries):
+        """建立警報郵件"""
+        now = datetime.now()
+        msg = self.MIMEMultipart()
+        msg["Subject"] = ALERT_SUBJECT.format(event_type=event_type, time=now.strftime('%Y/%m/%d %H:%M:%S'))
+        msg["From"] = self.mail_from
+        msg["To"] = self.mail_to
+        
+        # 簡化郵件內容以減少記憶體使用
+        body = ALERT_BODY.format(
+            event_type=event_type,
+            time=now.strftime('%Y年%m月%d日 %H時%M分%S秒'),
+            count=len(entries)
+        )
+        msg.attach(self.MIMEText(body, "plain"))
+        
+        # 附加 ZIP 檔案 (MIMEApplication 預設以 base64 編碼)
+        with open(zip_path, 'rb') as f:
+            part = self.MIMEApplication(f.read(), _subtype="zip")
+        part.add_header("Content-Disposition", f'attachment; filename="{event_type}_alert.zip"')
+        msg.attach(part)
+        return msg
+    
+    def _send_alert_batch(self, batch):
+        """以單一 SMTP 連線發送一批警報郵件"""
         try:
             if not all(self.smtp_config.values()):
                 logger.warning("SMTP 設定不完整，跳過郵件發送")
                 return
-                
-            msg = self.modules['MIMEMultipart']()
-            msg["Subject"] = f"🚨【緊急警報】NCCU 大仁樓 1F 機房偵測到 {event_type} - {datetime.now().strftime('%Y/%m/%d %H:%M:%S')}"
-            msg["From"] = self.smtp_config['USER']
-            msg["To"] = self.smtp_config['ALERT_TO']
-            
-            # 簡化郵件內容以減少記憶體使用
-            body = f"""🚨 NCCU 政治大學機房監控系統 - 緊急警報通知 🚨
-
-偵測位置：NCCU 大仁樓 1F（樓梯旁）機房
-事件類型：{event_type} 
-偵測時間：{datetime.now().strftime('%Y年%m月%d日 %H時%M分%S秒')}
-附件影像：{len(entries)} 張
-
-請立即前往現場查看！
-
-緊急聯絡人：李恩甫同學 (0958-242-580)
-
-NCCU 機房監控系統"""
-            
-            msg.attach(self.modules['MIMEText'](body, "plain"))
             
-            # 附加 ZIP 檔案
-            part = self.modules['MIMEBase']("application", "zip")
-            part.set_payload(zip_bytes.getvalue())
-            self.modules['encoders'].encode_base64(part)
-            part.add_header("Content-Disposition", f'attachment; filename="{event_type}_alert.zip"')
-            msg.attach(part)
+            messages = [
+                (a['event_type'], self._build_alert_message(a['event_type'], a['zip_path'], a['entries']))
+                for a in batch
+            ]
             
-            # 發送郵件 - 加入重試機制
+            # 發送郵件 - 加入重試機制，重試時只補送尚未送出的郵件
             retry_count = 3
             for i in range(retry_count):
                 try:
-                    with self.modules['smtplib'].SMTP(self.smtp_config['HOST'], self.smtp_config['PORT']) as server:
-                        server.starttls()
-                        server.login(self.smtp_config['USER'], self.smtp_config['PASS'])
+                    server = self._ensure_smtp()
+                    while messages:
+                        event_type, msg = messages[0]
                         server.send_message(msg)
-                    logger.info(f"警報郵件已發送: {event_type}")
+                        messages.pop(0)
+                        logger.info(f"警報郵件已發送: {event_type}")
+                    self.smtp_last_used = time.monotonic()
                     break
                 except Exception as e:
+                    # 連線可能已失效，下次重試時重新建立
+                    self._close_smtp()
                     if i < retry_count - 1:
                         logger.warning(f"郵件發送失敗，重試 {i+1}/{retry_count}: {e}")
                         time.sleep(5)
@@ -316,44 +679,45 @@ NCCU 機房監控系統"""
     
     def save_event(self, event_type, entries):
         """保存事件記錄 - 優化 I/O 操作"""
+        # 編碼期間釘選影格，避免擷取執行緒覆寫
+        slots = [e['slot'] for e in entries]
+        self.frame_pool.pin(slots)
         try:
             # 檢查磁碟空間
             if not self._check_disk_space():
                 logger.warning("磁碟空間不足，跳過保存")
                 return
                 
-            timestamp = entries[-1]['ts'].replace(' ', 'T')
+            # 感測器在第一張影格進入緩衝區前就觸發時，仍保存並發送不含影像的事件記錄
+            if entries:
+                timestamp = entries[-1]['ts'].replace(' ', 'T')
+            else:
+                logger.warning(f"{event_type} 事件發生時緩衝區尚無影格，僅記錄感測器事件")
+                timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
             zip_path = os.path.join(self.OUT_DIR, f"{event_type}_{timestamp}.zip")
             
-            # 使用記憶體緩衝區減少 I/O
-            with self.modules['io'].BytesIO() as buf:
-                with self.modules['zipfile'].ZipFile(buf, "w", compression=self.modules['zipfile'].ZIP_DEFLATED) as zf:
-                    for i, e in enumerate(entries):
-                        fn = f"{event_type}_{i+1}_{e['ts'].replace(' ', 'T')}.jpg"
-                        im = self.modules['Image'].fromarray(e["img"])
-                        with self.modules['io'].BytesIO() as img_buf:
-                            im.save(img_buf, format="JPEG", quality=85)  # 降低品質以節省空間
-                            zf.writestr(fn, img_buf.getvalue())
-                
-                # 保存到磁碟
-                buf.seek(0)
-                with open(zip_path, 'wb') as f:
-                    f.write(buf.getvalue())
-                
-                # 發送警報（非阻塞）
-                buf.seek(0)
-                self.send_alert(event_type, buf, entries)
-                
-            logger.info(f"事件已保存: {event_type} - {len(entries)} 張影像")
+            # 直接寫入同目錄的暫存檔，不在記憶體中另建一份 ZIP；完成後原子性更名
+            # JPEG 已是壓縮格式，DEFLATE 幾乎無效益，直接以 STORED 模式封裝
+            tmp_path = f"{zip_path}.tmp"
+            with self.ZipFile(tmp_path, "w", compression=self.ZIP_STORED) as zf:
+                for i, e in enumerate(entries):
+                    fn = f"{event_type}_{i+1}_{e['ts'].replace(' ', 'T')}.jpg"
+                    jpeg_bytes = self.jpeg.encode(
+                        e["img"], quality=85, pixel_format=self.TJPF_RGB  # 降低品質以節省空間
+                    )
+                    zf.writestr(fn, jpeg_bytes)
             
-            # 更新計數器
-            self.saved_image_count += len(entries)
-            if self.saved_image_count > self.max_saved_images:
-                self._cleanup_old_files()
-                self.saved_image_count = 0
+            os.rename(tmp_path, zip_path)
+            
+            # 發送警報（非阻塞），郵件執行緒發送時才從磁碟讀取附件
+            self.send_alert(event_type, zip_path, entries)
+            
+            logger.info(f"事件已保存: {event_type} - {len(entries)} 張影像")
                 
         except Exception as e:
             logger.error(f"事件保存失敗: {e}")
+        finally:
+            self.frame_pool.release(slots)
     
     def _check_disk_space(self):
         """檢查磁碟空間"""
@@ -374,26 +738,15 @@ NCCU 機房監控系統"""
         loop_count = 0
         last_stats_time = time.time()
         
+        next_deadline = time.monotonic()
+        
         while running:
             try:
-                loop_start = time.time()
-                
-                # 取得時間戳記
-                ts = datetime.now().isoformat(sep=" ", timespec="seconds")
-                
-                # 擷取影像
-                roi = self.capture_roi()
-                if roi is None:
-                    time.sleep(1)
-                    continue
-                
-                # 讀取感測器
-                smoke = not self.mq2.value
-                fire = not self.flame.value
+                # 讀取感測器（由邊緣事件更新，不會漏掉間隔中的脈衝）
+                smoke, fire = self._read_sensors()
                 
-                # 建立記錄
-                entry = {"ts": ts, "img": roi, "smoke": smoke, "fire": fire}
-                self.buffer.append(entry)
+                # 收取擷取執行緒的影格並建立記錄
+                frame_count = self._drain_frames(smoke, fire)
                 
                 # 處理火焰偵測
                 if fire:
@@ -436,17 +789,17 @@ NCCU 機房監控系統"""
                     self.save_event(event_type, list(self.buffer))
                 
                 # 統計資訊（每分鐘記錄一次）
-                loop_count += 1
+                loop_count += frame_count
                 if current_time - last_stats_time > 60:
                     fps = loop_count / (current_time - last_stats_time)
                     logger.info(f"系統狀態 - FPS: {fps:.2f}, 緩衝區: {len(self.buffer)}/{self.BUFFER_SIZE}")
+                    # 每分鐘至少寫入一次，看門狗依日誌更新時間判斷服務是否存活
+                    memory_handler.flush()
                     loop_count = 0
                     last_stats_time = current_time
                 
-                # 動態調整延遲以維持穩定的擷取間隔
-                loop_time = time.time() - loop_start
-                sleep_time = max(0, self.CAP_INTERVAL - loop_time)
-                time.sleep(sleep_time)
+                # 依絕對期限休眠，維持穩定的感測取樣間隔
+                next_deadline = self._wait_until_next(next_deadline, self.SENSOR_INTERVAL, time.sleep)
                 
             except KeyboardInterrupt:
                 logger.info("收到中斷信號")
@@ -459,22 +812,32 @@ NCCU 機房監控系統"""
     def cleanup(self):
         """清理資源"""
         try:
+            # 停止定期清理
+            if self.cleanup_timer:
+                self.cleanup_timer.cancel()
+            
             # 停止警報執行緒
             if self.alert_queue:
                 self.alert_queue.put(None)
                 if self.alert_thread and self.alert_thread.is_alive():
                     self.alert_thread.join(timeout=5)
             
+            # 停止擷取執行緒後再關閉攝影機
+            self.capture_stop.set()
+            if self.capture_thread and self.capture_thread.is_alive():
+                self.capture_thread.join(timeout=5)
+            
             # 關閉攝影機
             if self.camera:
                 self.camera.close()
                 logger.info("攝影機已關閉")
                 
-            # 清理感測器
-            if self.mq2:
-                self.mq2.deinit()
-            if self.flame:
-                self.flame.deinit()
+            # 停止 GPIO 事件執行緒並釋放腳位
+            self.gpio_stop.set()
+            if self.gpio_thread and self.gpio_thread.is_alive():
+                self.gpio_thread.join(timeout=5)
+            if self.gpio_request:
+                self.gpio_request.release()
                 
         except Exception as e:
             logger.error(f"清理失敗: {e}")
@@ -4,99 +4,181 @@ NCCU 機房監控系統 - 守護程序版本
 專為長期背景運作設計，具備自動重啟和錯誤恢復機制
 """
 
+import atexit
+import io
 import os
+import queue
+import shutil
+import smtplib
 import sys
 import time
 import signal
 import logging
 import traceback
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
 from pathlib import Path
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 # 確保在正確的目錄下運行
 SCRIPT_DIR = Path(__file__).parent
 os.chdir(SCRIPT_DIR)
 
-# 設定日誌系統
+# 設定日誌系統 - 監控迴圈只將記錄放入佇列，由背景執行緒寫入檔案與終端機，
+# SD 卡寫入延遲不會阻塞擷取
 LOG_DIR = SCRIPT_DIR / "logs"
 LOG_DIR.mkdir(exist_ok=True)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_DIR / "monitor.log"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+log_format = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+# 檔案處理器 - 最大 5MB，保留 5 個備份
+file_handler = RotatingFileHandler(LOG_DIR / "monitor.log", maxBytes=5_000_000, backupCount=5)
+file_handler.setFormatter(log_format)
+console_handler = logging.StreamHandler(sys.stdout)
+console_handler.setFormatter(log_format)
+
+log_queue = queue.Queue(-1)
+log_listener = QueueListener(log_queue, file_handler, console_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(QueueHandler(log_queue))
+
+# 硬體與第三方模組只在載入時解析一次，缺少時由 initialize() 回報
+try:
+    from picamera import PiCamera
+    import board
+    import digitalio
+    from dotenv import load_dotenv
+    import numpy as np
+    IMPORT_ERROR = None
+except Exception as e:
+    IMPORT_ERROR = e
+
+# libjpeg-turbo 編碼器 (SIMD)，無法使用時退回 PIL
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+except ImportError:
+    TurboJPEG = None
 
 # 全域變數
 running = True
 restart_count = 0
 max_restarts = 10
 
+# 警報郵件範本 - 只在發送時填入事件類型、時間與影像數
+ALERT_SUBJECT = "🚨【緊急警報】NCCU 大仁樓 1F 機房偵測到 {event_type} - {time}"
+ALERT_BODY = """🚨 NCCU 政治大學機房監控系統 - 緊急警報通知 🚨
+
+偵測位置：NCCU 大仁樓 1F（樓梯旁）機房
+事件類型：{event_type} 
+偵測時間：{time}
+
+⚠️  警報詳情：
+系統偵測到機房內有異常{event_type}反應，請立即派員前往現場查看！
+
+📍 機房位置：
+- 建築物：大仁樓
+- 樓層：1樓
+- 位置：樓梯旁機房
+
+📞 緊急聯絡人：
+李恩甫同學
+電話：0958-242-580
+
+📷 監控影像說明：
+附件中包含 {count} 張連續拍攝的監控照片，完整記錄了警報觸發前後的現場狀況：
+
+• 第 1 張照片：警報觸發前 {history} 秒的正常狀態
+• 第 2-{last_middle} 張照片：異常狀況逐步發展的過程
+• 第 {count} 張照片：警報觸發當下的現場畫面
+
+請仔細查看這些連續的監控照片，特別注意以下幾點：
+✓ 是否有明顯的煙霧或火光出現
+✓ 機房設備是否有異常狀況（如冒煙、火花等）
+✓ 環境光線、顏色是否有明顯變化
+✓ 是否有人員在現場
+
+這些照片以每秒一張的頻率連續拍攝，可以清楚看出事件的發展過程。
+
+📋 緊急處理步驟：
+1. 立即前往現場查看機房狀況
+2. 確認是否有實際火災或煙霧
+3. 如有緊急情況，請立即撥打119
+4. 檢查所有機房設備是否正常運作
+5. 處理完畢後請回報系統管理員處理結果
+
+📎 附件說明：
+本郵件附件為 ZIP 壓縮檔，包含警報觸發時的完整監控影像記錄。
+• 檔案名稱：{event_type}_alert.zip
+• 檔案內容：{count} 張 JPG 格式的高清監控照片
+• 照片解析度：根據攝影機設定
+• 拍攝時間：每張照片檔名包含精確時間戳記
+
+⚠️ 重要提醒：
+此為自動發送的警報郵件，系統將持續監控機房狀況。
+若您無法查看附件或需要更多協助，請立即聯繫系統管理員。
+
+NCCU 機房監控系統
+政治大學資訊科學系"""
+
 def signal_handler(signum, frame):
     """處理系統信號，優雅關閉"""
     global running
     logger.info(f"收到信號 {signum}，準備關閉系統...")
     running = False
 
-def import_monitor_modules():
-    """動態導入監控模組"""
-    try:
-        import io
-        import zipfile
-        import smtplib
-        from collections import deque
-        from email.mime.multipart import MIMEMultipart
-        from email.mime.base import MIMEBase
-        from email.mime.text import MIMEText
-        from email import encoders
-        from picamera import PiCamera
-        from PIL import Image
-        import board
-        import digitalio
-        from dotenv import load_dotenv
-        import numpy as np
-        
-        return {
-            'io': io, 'zipfile': zipfile, 'smtplib': smtplib,
-            'deque': deque, 'MIMEMultipart': MIMEMultipart,
-            'MIMEBase': MIMEBase, 'MIMEText': MIMEText,
-            'encoders': encoders, 'PiCamera': PiCamera,
-            'Image': Image, 'board': board, 'digitalio': digitalio,
-            'load_dotenv': load_dotenv, 'np': np
-        }
-    except Exception as e:
-        logger.error(f"模組導入失敗: {e}")
-        return None
-
 class MonitorSystem:
     """監控系統核心類別"""
     
     def __init__(self):
-        self.modules = None
+        self.jpeg = None
         self.camera = None
         self.mq2 = None
         self.flame = None
-        self.buffer = None
+        self._read_pin = None
+        
+        # 環狀緩衝區：影像、時間戳記與感測器狀態各存於預先配置的陣列
+        # _head 為下一個寫入位置，_filled 為有效筆數
+        self._img_ring = None
+        self._ts_ring = None
+        self._smoke_ring = None
+        self._fire_ring = None
+        self._head = 0
+        self._filled = 0
+        self._tick_count = 0
         self.smtp_config = {}
         self.fire_count = 0
         self.fire_threshold = 3  # 需要連續 3 次偵測到火焰才觸發警報
+        self.smoke_count = 0
+        self.smoke_threshold = 2  # 需要連續 2 次偵測到煙霧才觸發警報
         self.last_fire_alert = None
+        self.last_smoke_alert = None
         self.alert_cooldown = 300  # 5 分鐘內不重複發送同類型警報
+        self._smtp = None  # 已登入的 SMTP 連線，跨警報重複使用
+        
+        # 事件處理（編碼、ZIP、郵件）交由單一背景執行緒，監控迴圈不受阻塞
+        self.max_pending_events = 4  # 超過此數量的待處理事件直接捨棄
+        self.min_free_bytes = 100 * 1024 * 1024  # SD 卡剩餘空間不足 100MB 時捨棄事件
+        self._alert_pool = None
+        self._event_slots = None
         
     def initialize(self):
         """初始化系統"""
         try:
-            # 導入模組
-            self.modules = import_monitor_modules()
-            if not self.modules:
+            # 檢查模組
+            if IMPORT_ERROR is not None:
+                logger.error(f"模組導入失敗: {IMPORT_ERROR}")
                 return False
-                
+            
             # 載入環境變數
-            self.modules['load_dotenv']()
+            load_dotenv()
             
             # SMTP 設定
             self.smtp_config = {
@@ -116,28 +198,54 @@ class MonitorSystem:
             self.CAP_INTERVAL = 5
             self.ROI = (100, 80, 200, 150)
             self.OUT_DIR = "captures"
+            # 除錯用：另外保存個別 JPEG 檔
+            self.KEEP_INDIVIDUAL_FILES = os.getenv("DEBUG_KEEP_INDIVIDUAL_FILES", "0") == "1"
+            # 火焰信號需搭配 ROI 偏紅才計入（預設關閉，避免攝影機未拍到火源時壓下警報）
+            self.FIRE_IMAGE_CUE = os.getenv("FIRE_IMAGE_CUE", "0") == "1"
             
             # 建立輸出目錄
             os.makedirs(self.OUT_DIR, exist_ok=True)
             
             # 初始化感測器
-            board = self.modules['board']
-            digitalio = self.modules['digitalio']
-            
             self.mq2 = digitalio.DigitalInOut(board.D17)
             self.mq2.direction = digitalio.Direction.INPUT
             
             self.flame = digitalio.DigitalInOut(board.D27)
             self.flame.direction = digitalio.Direction.INPUT
             
+            # 快取未綁定的 value 屬性 getter，每次讀取省去描述器查詢
+            self._read_pin = type(self.mq2).value.fget
+            
             # 初始化攝影機
-            self.camera = self.modules['PiCamera']()
+            self.camera = PiCamera()
             self.camera.resolution = (640, 480)
+            
+            # 由 ISP 直接裁切 ROI，擷取時只傳輸 ROI 大小的影像
+            x, y, w, h = self.ROI
+            self.camera.zoom = (x / 640, y / 480, w / 640, h / 480)
+            
             self.camera.start_preview()
             time.sleep(2)
             
-            # 初始化緩衝區
-            self.buffer = self.modules['deque'](maxlen=self.BUFFER_SIZE)
+            # 初始化環狀緩衝區，執行期間不再配置影格記憶體
+            # 槽位依未編碼擷取的大小配置（寬補齊至 32 的倍數、高補齊至 16 的倍數），
+            # 攝影機可直接寫入槽位
+            padded_h, padded_w = (h + 15) // 16 * 16, (w + 31) // 32 * 32
+            self._img_ring = np.empty((self.BUFFER_SIZE, padded_h, padded_w, 3), dtype=np.uint8)
+            self._ts_ring = np.zeros(self.BUFFER_SIZE, dtype=np.int64)  # epoch 秒
+            self._smoke_ring = np.zeros(self.BUFFER_SIZE, dtype=bool)
+            self._fire_ring = np.zeros(self.BUFFER_SIZE, dtype=bool)
+            
+            # JPEG 編碼器：libjpeg-turbo 無法載入時由 encode_jpeg 退回 PIL
+            if TurboJPEG is not None:
+                try:
+                    self.jpeg = TurboJPEG()
+                except RuntimeError as e:
+                    logger.warning(f"無法載入 libjpeg-turbo，改用 PIL 編碼: {e}")
+            
+            # 事件處理執行緒
+            self._alert_pool = ThreadPoolExecutor(max_workers=1)
+            self._event_slots = threading.Semaphore(self.max_pending_events)
             
             logger.info("系統初始化完成")
             return True
@@ -147,138 +255,176 @@ class MonitorSystem:
             logger.error(traceback.format_exc())
             return False
     
-    def capture_roi(self):
-        """擷取 ROI 區域影像"""
+    def capture_roi(self, slot):
+        """擷取 ROI 區域影像並寫入環狀緩衝區的槽位"""
         try:
-            stream = self.modules['io'].BytesIO()
-            self.camera.capture(stream, format='jpeg')
-            stream.seek(0)
-            img = self.modules['Image'].open(stream).convert("RGB")
-            np_img = self.modules['np'].array(img)
-            x, y, w, h = self.ROI
-            roi = np_img[y:y+h, x:x+w].copy()
-            return roi
+            # 直接擷取 ROI 大小的 RGB 到槽位，省去 JPEG 編碼與解碼及額外複製
+            _, _, w, h = self.ROI
+            self.camera.capture(slot, format='rgb', resize=(w, h), use_video_port=True)
+            return slot[:h, :w]  # 檢視，不複製
         except Exception as e:
             logger.error(f"影像擷取失敗: {e}")
             return None
     
-    def send_alert(self, event_type, zip_bytes, entries):
+    def _read_sensors(self):
+        """一次讀取兩個感測器（皆為低電位觸發）
+        
+        Returns:
+            (smoke, fire)
+        """
+        read_pin = self._read_pin
+        return not read_pin(self.mq2), not read_pin(self.flame)
+    
+    @staticmethod
+    def _fire_cue(roi):
+        """以 ROI 的 RGB 平均值判斷畫面是否偏紅（單次向量化運算）"""
+        r, g, b = roi.mean(axis=(0, 1))
+        return r > 1.4 * g and r > 1.4 * b and r > 120
+    
+    def encode_jpeg(self, img):
+        """將 ROI 編碼為 JPEG 位元組"""
+        if self.jpeg is not None:
+            return self.jpeg.encode(img, quality=85, pixel_format=TJPF_RGB)
+        from PIL import Image  # 僅在沒有 libjpeg-turbo 時使用
+        with io.BytesIO() as img_buf:
+            Image.fromarray(img).save(img_buf, format="JPEG", quality=85)
+            return img_buf.getvalue()
+    
+    def _get_smtp(self):
+        """取得已登入的 SMTP 連線，連線失效時重新建立"""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_smtp()
+        
+        server = smtplib.SMTP(self.smtp_config['HOST'], self.smtp_config['PORT'], timeout=30)
+        try:
+            server.starttls()
+            server.login(self.smtp_config['USER'], self.smtp_config['PASS'])
+        except Exception:
+            server.close()
+            raise
+        self._smtp = server
+        return server
+    
+    def _close_smtp(self):
+        """關閉 SMTP 連線"""
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+    
+    def send_alert(self, event_type, zip_bytes, count):
         """發送警報郵件"""
         try:
             if not all(self.smtp_config.values()):
                 logger.warning("SMTP 設定不完整，跳過郵件發送")
                 return
                 
-            msg = self.modules['MIMEMultipart']()
-            msg["Subject"] = f"🚨【緊急警報】NCCU 大仁樓 1F 機房偵測到 {event_type} - {datetime.now().strftime('%Y/%m/%d %H:%M:%S')}"
+            now = datetime.now()
+            msg = MIMEMultipart()
+            msg["Subject"] = ALERT_SUBJECT.format(event_type=event_type, time=now.strftime('%Y/%m/%d %H:%M:%S'))
             msg["From"] = self.smtp_config['USER']
             msg["To"] = self.smtp_config['ALERT_TO']
             
-            body = f"""🚨 NCCU 政治大學機房監控系統 - 緊急警報通知 🚨
-
-偵測位置：NCCU 大仁樓 1F（樓梯旁）機房
-事件類型：{event_type} 
-偵測時間：{datetime.now().strftime('%Y年%m月%d日 %H時%M分%S秒')}
-
-⚠️  警報詳情：
-系統偵測到機房內有異常{event_type}反應，請立即派員前往現場查看！
-
-📍 機房位置：
-- 建築物：大仁樓
-- 樓層：1樓
-- 位置：樓梯旁機房
-
-📞 緊急聯絡人：
-李恩甫同學
-電話：0958-242-580
-
-📷 監控影像說明：
-附件中包含 {len(entries)} 張連續拍攝的監控照片，完整記錄了警報觸發前後的現場狀況：
-
-• 第 1 張照片：警報觸發前 {self.BUFFER_SIZE-1} 秒的正常狀態
-• 第 2-{len(entries)-1} 張照片：異常狀況逐步發展的過程
-• 第 {len(entries)} 張照片：警報觸發當下的現場畫面
-
-請仔細查看這些連續的監控照片，特別注意以下幾點：
-✓ 是否有明顯的煙霧或火光出現
-✓ 機房設備是否有異常狀況（如冒煙、火花等）
-✓ 環境光線、顏色是否有明顯變化
-✓ 是否有人員在現場
-
-這些照片以每秒一張的頻率連續拍攝，可以清楚看出事件的發展過程。
-
-📋 緊急處理步驟：
-1. 立即前往現場查看機房狀況
-2. 確認是否有實際火災或煙霧
-3. 如有緊急情況，請立即撥打119
-4. 檢查所有機房設備是否正常運作
-5. 處理完畢後請回報系統管理員處理結果
-
-📎 附件說明：
-本郵件附件為 ZIP 壓縮檔，包含警報觸發時的完整監控影像記錄。
-• 檔案名稱：{event_type}_alert.zip
-• 檔案內容：{len(entries)} 張 JPG 格式的高清監控照片
-• 照片解析度：根據攝影機設定
-• 拍攝時間：每張照片檔名包含精確時間戳記
-
-⚠️ 重要提醒：
-此為自動發送的警報郵件，系統將持續監控機房狀況。
-若您無法查看附件或需要更多協助，請立即聯繫系統管理員。
-
-NCCU 機房監控系統
-政治大學資訊科學系"""
-            msg.attach(self.modules['MIMEText'](body, "plain"))
+            body = ALERT_BODY.format(
+                event_type=event_type,
+                time=now.strftime('%Y年%m月%d日 %H時%M分%S秒'),
+                count=count,
+                history=self.BUFFER_SIZE - 1,
+                last_middle=count - 1
+            )
+            msg.attach(MIMEText(body, "plain"))
             
             # 附加 ZIP 檔案
-            part = self.modules['MIMEBase']("application", "zip")
-            part.set_payload(zip_bytes.getvalue())
-            self.modules['encoders'].encode_base64(part)
+            # MIMEApplication 一次完成原始 ZIP 位元組的 base64 編碼
+            part = MIMEApplication(zip_bytes, _subtype="zip")
             part.add_header("Content-Disposition", f'attachment; filename="{event_type}_alert.zip"')
             msg.attach(part)
             
-            # 發送郵件
-            with self.modules['smtplib'].SMTP(self.smtp_config['HOST'], self.smtp_config['PORT']) as server:
-                server.starttls()
-                server.login(self.smtp_config['USER'], self.smtp_config['PASS'])
-                server.send_message(msg)
+            # 發送郵件 - 重複使用既有連線，連線中斷時重新連線後再送一次
+            try:
+                self._get_smtp().send_message(msg)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._close_smtp()
+                self._get_smtp().send_message(msg)
                 
             logger.info(f"警報郵件已發送: {event_type}")
             
         except Exception as e:
             logger.error(f"郵件發送失敗: {e}")
     
-    def save_event(self, event_type, entries):
+    def snapshot(self):
+        """依時間順序（舊到新）複製緩衝區內容，背景執行緒不受後續擷取影響"""
+        order = np.arange(self._head - self._filled, self._head) % self.BUFFER_SIZE
+        _, _, w, h = self.ROI
+        return self._ts_ring[order], self._img_ring[order, :h, :w]
+    
+    @staticmethod
+    def _fmt_ts(t):
+        """將 epoch 秒格式化為檔名用的時間戳記，只在保存事件時呼叫"""
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t))
+    
+    def save_event(self, event_type, timestamps, images):
         """保存事件記錄"""
         try:
-            timestamp = entries[-1]['ts'].replace(' ', 'T')
+            timestamp = self._fmt_ts(timestamps[-1])
             zip_path = os.path.join(self.OUT_DIR, f"{event_type}_{timestamp}.zip")
             
-            # 保存到磁碟
-            with self.modules['zipfile'].ZipFile(zip_path, "w") as zf:
-                for i, e in enumerate(entries):
-                    fn = f"{event_type}_{i+1}_{e['ts'].replace(' ', 'T')}.jpg"
-                    img_path = os.path.join(self.OUT_DIR, fn)
-                    self.modules['Image'].fromarray(e["img"]).save(img_path)
-                    zf.write(img_path, arcname=fn)
-            
-            # 建立記憶體 ZIP 用於郵件
-            with self.modules['io'].BytesIO() as buf:
-                with self.modules['zipfile'].ZipFile(buf, "w") as zf:
-                    for i, e in enumerate(entries):
-                        fn = f"{event_type}_{i+1}_{e['ts'].replace(' ', 'T')}.jpg"
-                        im = self.modules['Image'].fromarray(e["img"])
-                        with self.modules['io'].BytesIO() as img_buf:
-                            im.save(img_buf, format="JPEG")
-                            zf.writestr(fn, img_buf.getvalue())
-                
-                # 發送警報
-                self.send_alert(event_type, buf, entries)
-                
-            logger.info(f"事件已保存: {event_type} - {len(entries)} 張影像")
+            # 每張影像只編碼一次，郵件與磁碟共用同一份 ZIP
+            encoded = [
+                (f"{event_type}_{i+1}_{self._fmt_ts(ts)}.jpg", self.encode_jpeg(img))
+                for i, (ts, img) in enumerate(zip(timestamps, images))
+            ]
+            
+            # 先建立記憶體 ZIP 並發送警報，避免郵件被 SD 卡寫入延誤
+            # 刻意使用 STORED：JPEG 已壓縮，DEFLATE 縮減不到 1% 卻耗費大量 CPU
+            with io.BytesIO() as buf:
+                with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED, allowZip64=False) as zf:
+                    for fn, data in encoded:
+                        zf.writestr(fn, data)
+                zip_bytes = buf.getvalue()
+            
+            # 發送警報（發送失敗僅記錄，不影響下方保存）
+            self.send_alert(event_type, zip_bytes, len(encoded))
+            
+            # 保存到磁碟：直接寫入同一份 ZIP，不另存個別 JPEG 再讀回
+            with open(zip_path, 'wb') as f:
+                f.write(zip_bytes)
+            
+            if self.KEEP_INDIVIDUAL_FILES:
+                for fn, data in encoded:
+                    with open(os.path.join(self.OUT_DIR, fn), 'wb') as f:
+                        f.write(data)
+            
+            logger.info(f"事件已保存: {event_type} - {len(encoded)} 張影像")
             
         except Exception as e:
             logger.error(f"事件保存失敗: {e}")
     
+    def dispatch_event(self, event_type):
+        """將事件交給背景執行緒處理，磁碟空間不足或待處理事件過多時捨棄
+        
+        Returns:
+            事件是否已送出處理
+        """
+        if shutil.disk_usage(self.OUT_DIR).free < self.min_free_bytes:
+            logger.warning(f"{event_type} 事件已捨棄，磁碟剩餘空間不足 {self.min_free_bytes // (1024 * 1024)}MB")
+            return False
+        if not self._event_slots.acquire(blocking=False):
+            logger.warning(f"{event_type} 事件已捨棄，尚有 {self.max_pending_events} 個事件待處理")
+            return False
+        timestamps, images = self.snapshot()
+        future = self._alert_pool.submit(self.save_event, event_type, timestamps, images)
+        future.add_done_callback(lambda _: self._event_slots.release())
+        return True
+    
     def monitor_loop(self):
         """主要監控迴圈"""
         global running
@@ -287,22 +433,28 @@ NCCU 機房監控系統
         
         while running:
             try:
-                # 取得時間戳記
-                ts = datetime.now().isoformat(sep=" ", timespec="seconds")
+                self._tick_count += 1
                 
-                # 擷取影像
-                roi = self.capture_roi()
+                # 取得時間戳記（epoch 秒，保存事件時才格式化）
+                ts = int(time.time())
+                
+                # 擷取影像（直接寫入環狀緩衝區）
+                roi = self.capture_roi(self._img_ring[self._head])
                 if roi is None:
                     time.sleep(1)
                     continue
                 
                 # 讀取感測器
-                smoke = not self.mq2.value
-                fire = not self.flame.value
+                smoke, fire = self._read_sensors()
+                if fire and self.FIRE_IMAGE_CUE:
+                    fire = self._fire_cue(roi)
                 
                 # 建立記錄
-                entry = {"ts": ts, "img": roi, "smoke": smoke, "fire": fire}
-                self.buffer.append(entry)
+                self._ts_ring[self._head] = ts
+                self._smoke_ring[self._head] = smoke
+                self._fire_ring[self._head] = fire
+                self._head = (self._head + 1) % self.BUFFER_SIZE
+                self._filled = min(self._filled + 1, self.BUFFER_SIZE)
                 
                 # 處理火焰偵測（需要連續多次偵測才觸發）
                 if fire:
@@ -311,27 +463,40 @@ NCCU 機房監控系統
                 else:
                     self.fire_count = 0  # 重置計數器
                 
+                # 處理煙霧偵測（與火焰相同，需要連續多次偵測才觸發）
+                if smoke:
+                    self.smoke_count += 1
+                    logger.info(f"偵測到煙霧信號 ({self.smoke_count}/{self.smoke_threshold})")
+                else:
+                    self.smoke_count = 0
+                
                 # 檢查是否需要發送警報
                 current_time = time.time()
                 should_alert_fire = (self.fire_count >= self.fire_threshold and 
                                    (self.last_fire_alert is None or 
                                     current_time - self.last_fire_alert > self.alert_cooldown))
                 
+                should_alert_smoke = (self.smoke_count >= self.smoke_threshold and 
+                                    (self.last_smoke_alert is None or 
+                                     current_time - self.last_smoke_alert > self.alert_cooldown))
+                
                 # 檢查警報條件
-                if smoke or should_alert_fire:
-                    if should_alert_fire:
-                        event_type = "FIRE"
-                        self.last_fire_alert = current_time
-                        self.fire_count = 0  # 重置計數器
-                    else:
-                        event_type = "SMOKE"
-                    
+                if should_alert_fire or should_alert_smoke:
+                    event_type = "FIRE" if should_alert_fire else "SMOKE"
                     logger.warning(f"偵測到 {event_type}！正在保存記錄...")
-                    self.save_event(event_type, list(self.buffer))
+                    
+                    # 事件確實送出後才進入冷卻；被捨棄時下一輪會再嘗試
+                    if self.dispatch_event(event_type):
+                        if should_alert_fire:
+                            self.last_fire_alert = current_time
+                            self.fire_count = 0  # 重置計數器
+                        else:
+                            self.last_smoke_alert = current_time
+                            self.smoke_count = 0
                 
                 # 記錄狀態（每 10 次記錄一次以免日誌過多）
-                if len(self.buffer) % 10 == 0:
-                    logger.info(f"系統正常運作 - 緩衝區: {len(self.buffer)}/{self.BUFFER_SIZE}")
+                if self._tick_count % 10 == 0:
+                    logger.info(f"系統正常運作 - 緩衝區: {self._filled}/{self.BUFFER_SIZE}")
                 
                 time.sleep(self.CAP_INTERVAL)
                 
@@ -346,6 +511,10 @@ NCCU 機房監控系統
     def cleanup(self):
         """清理資源"""
         try:
+            # 等待待處理事件完成後再關閉連線
+            if self._alert_pool:
+                self._alert_pool.shutdown(wait=True)
+            self._close_smtp()
             if self.camera:
                 self.camera.close()
                 logger.info("攝影機已關閉")
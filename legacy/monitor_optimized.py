@@ -6,6 +6,8 @@ NCCU 機房監控系統 - 優化版本
 
 import os
 import sys
+import base64
+import mmap
 import time
 import signal
 import logging
@@ -13,9 +15,10 @@ import traceback
 import threading
 import queue
 import gc
+import heapq
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from collections import deque
 
 # 確保在正確的目錄下運行
 SCRIPT_DIR = Path(__file__).parent
@@ -27,14 +30,20 @@ LOG_DIR.mkdir(exist_ok=True)
 
 class RotatingFileHandler(logging.FileHandler):
     """自定義的日誌輪轉處理器，避免日誌檔案過大"""
+    CHECK_BYTES = 64 * 1024  # 累計寫入約 64 KB 才查詢一次檔案位置
+    
     def __init__(self, filename, max_bytes=10*1024*1024, backup_count=3):
         super().__init__(filename)
         self.max_bytes = max_bytes
         self.backup_count = backup_count
+        self._unchecked_bytes = 0
         
     def emit(self, record):
-        if self.stream and self.stream.tell() > self.max_bytes:
-            self.rotate()
+        self._unchecked_bytes += len(record.getMessage())
+        if self._unchecked_bytes >= self.CHECK_BYTES:
+            self._unchecked_bytes = 0
+            if self.stream and self.stream.tell() > self.max_bytes:
+                self.rotate()
         super().emit(record)
         
     def rotate(self):
@@ -73,27 +82,24 @@ def signal_handler(signum, frame):
 def import_monitor_modules():
     """優化的模組導入"""
     try:
-        import io
         import zipfile
         import smtplib
-        from collections import deque
         from email.mime.multipart import MIMEMultipart
         from email.mime.base import MIMEBase
         from email.mime.text import MIMEText
-        from email import encoders
         from picamera import PiCamera
-        from PIL import Image
+        from turbojpeg import TurboJPEG, TJPF_RGB
         import board
         import digitalio
         from dotenv import load_dotenv
         import numpy as np
         
         return {
-            'io': io, 'zipfile': zipfile, 'smtplib': smtplib,
-            'deque': deque, 'MIMEMultipart': MIMEMultipart,
+            'zipfile': zipfile, 'smtplib': smtplib,
+            'MIMEMultipart': MIMEMultipart,
             'MIMEBase': MIMEBase, 'MIMEText': MIMEText,
-            'encoders': encoders, 'PiCamera': PiCamera,
-            'Image': Image, 'board': board, 'digitalio': digitalio,
+            'PiCamera': PiCamera,
+            'TurboJPEG': TurboJPEG, 'TJPF_RGB': TJPF_RGB, 'board': board, 'digitalio': digitalio,
             'load_dotenv': load_dotenv, 'np': np
         }
     except Exception as e:
@@ -108,82 +114,85 @@ class StorageManager:
         self.max_size_bytes = int(max_size_gb * 1024 * 1024 * 1024)
         self.max_age_days = max_age_days
         
+    def _walk(self):
+        """以 os.scandir 遞迴走訪目錄，回傳檔案的 DirEntry"""
+        stack = [str(self.base_dir)]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+    
     def get_directory_size(self):
         """計算目錄大小"""
         total_size = 0
         try:
-            for file_path in self.base_dir.rglob('*'):
-                if file_path.is_file():
-                    total_size += file_path.stat().st_size
+            for entry in self._walk():
+                total_size += entry.stat().st_size
         except Exception as e:
             logger.error(f"計算目錄大小失敗: {e}")
         return total_size
     
-    def cleanup_old_files(self):
-        """清理過期檔案"""
+    def _unlink(self, path):
+        """刪除檔案，回傳是否成功"""
         try:
-            cutoff_time = time.time() - (self.max_age_days * 24 * 3600)
-            deleted_count = 0
-            freed_bytes = 0
-            
-            for file_path in self.base_dir.rglob('*'):
-                if file_path.is_file() and file_path.stat().st_mtime < cutoff_time:
-                    try:
-                        file_size = file_path.stat().st_size
-                        file_path.unlink()
-                        deleted_count += 1
-                        freed_bytes += file_size
-                    except Exception as e:
-                        logger.warning(f"無法刪除檔案 {file_path}: {e}")
-            
-            if deleted_count > 0:
-                logger.info(f"清理過期檔案: {deleted_count} 個檔案, 釋放 {freed_bytes/1024/1024:.1f} MB")
-                
+            os.unlink(path)
+            return True
         except Exception as e:
-            logger.error(f"清理過期檔案失敗: {e}")
+            logger.warning(f"無法刪除檔案 {path}: {e}")
+            return False
     
-    def cleanup_by_size(self):
-        """按大小清理檔案"""
+    def cleanup_files(self):
+        """單次走訪同時清理過期檔案與超出容量的檔案"""
         try:
-            current_size = self.get_directory_size()
+            cutoff_time = time.time() - (self.max_age_days * 24 * 3600)
+            expired_count = 0
+            expired_bytes = 0
+            files = []
+            current_size = 0
+            
+            # 每個檔案只 stat 一次：過期的直接刪除，其餘留待容量檢查
+            for entry in self._walk():
+                st = entry.stat()
+                if st.st_mtime < cutoff_time:
+                    if self._unlink(entry.path):
+                        expired_count += 1
+                        expired_bytes += st.st_size
+                else:
+                    files.append((st.st_mtime, st.st_size, entry.path))
+                    current_size += st.st_size
+            
+            if expired_count > 0:
+                logger.info(f"清理過期檔案: {expired_count} 個檔案, 釋放 {expired_bytes/1024/1024:.1f} MB")
+            
             if current_size <= self.max_size_bytes:
                 return
             
-            # 取得所有檔案並按時間排序（舊的先刪除）
-            files_with_time = []
-            for file_path in self.base_dir.rglob('*'):
-                if file_path.is_file():
-                    files_with_time.append((file_path.stat().st_mtime, file_path))
-            
-            files_with_time.sort()  # 按時間排序
+            # 以最小堆積依時間取出最舊的檔案，只需排序實際要刪除的部分
+            heapq.heapify(files)
             
             deleted_count = 0
             freed_bytes = 0
             target_size = self.max_size_bytes * 0.8  # 清理到 80% 容量
             
-            for mtime, file_path in files_with_time:
-                if current_size - freed_bytes <= target_size:
-                    break
-                    
-                try:
-                    file_size = file_path.stat().st_size
-                    file_path.unlink()
+            while files and current_size - freed_bytes > target_size:
+                mtime, file_size, file_path = heapq.heappop(files)
+                if self._unlink(file_path):
                     deleted_count += 1
                     freed_bytes += file_size
-                except Exception as e:
-                    logger.warning(f"無法刪除檔案 {file_path}: {e}")
             
             if deleted_count > 0:
                 logger.info(f"空間清理: 刪除 {deleted_count} 個檔案, 釋放 {freed_bytes/1024/1024:.1f} MB")
                 
         except Exception as e:
-            logger.error(f"空間清理失敗: {e}")
+            logger.error(f"儲存空間清理失敗: {e}")
     
     def perform_cleanup(self):
         """執行清理作業"""
         logger.info("開始儲存空間清理...")
-        self.cleanup_old_files()
-        self.cleanup_by_size()
+        self.cleanup_files()
         
         # 強制垃圾回收
         gc.collect()
@@ -220,19 +229,36 @@ class PerformanceMonitor:
 class OptimizedMonitorSystem:
     """優化的監控系統核心類別"""
     
+    EVENT_IDS = {'SMOKE': 0, 'FIRE': 1}
+    
     def __init__(self):
         self.modules = None
         self.camera = None
         self.mq2 = None
         self.flame = None
-        self.buffer = None
+        # 環形緩衝區 (SoA)：影格、時間戳記與感測器狀態各自連續存放
+        self._frames = None
+        self._ts = None
+        self._smoke = None
+        self._fire = None
+        self._head = 0  # 下一個寫入位置
+        self._count = 0  # 有效影格數
+        self._smoke_hist = None
+        self._fire_hist = None
+        self._hist_i = 0
         self.smtp_config = {}
         self.storage_manager = None
+        self.jpeg = None
+        self.encode_pool = None
         self.performance_monitor = PerformanceMonitor()
-        self.last_cleanup_time = 0
+        self.cleanup_interval = 3600  # 儲存空間清理間隔（秒）
         self.email_queue = queue.Queue(maxsize=10)  # 限制郵件佇列大小
         self.email_thread = None
-        self.last_alert_time = {}  # 防止重複警報
+        self.smtp = None  # 郵件執行緒持續使用的 SMTP 連線
+        self.smtp_last_used = 0
+        self.smtp_idle_timeout = 300  # 閒置 5 分鐘後關閉連線
+        self.last_alert_time = None  # 各事件類型上次警報時間，防止重複警報
+        self.email_batch_window = 0.5  # 合併此時間內相繼發生的警報（秒）
         
     def initialize(self):
         """初始化系統"""
@@ -270,6 +296,8 @@ class OptimizedMonitorSystem:
             self.OUT_DIR = "captures"
             self.IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 75))  # JPEG 品質
             self.ALERT_COOLDOWN = int(os.getenv("ALERT_COOLDOWN", 300))  # 警報冷卻時間(秒)
+            self.SENSOR_WINDOW = int(os.getenv("SENSOR_WINDOW", 4))  # 感測器滑動視窗取樣數
+            self.SENSOR_THRESHOLD = int(os.getenv("SENSOR_THRESHOLD", 2))  # 視窗內觸發次數門檻
             
             # 建立輸出目錄
             os.makedirs(self.OUT_DIR, exist_ok=True)
@@ -293,11 +321,38 @@ class OptimizedMonitorSystem:
             self.camera = self.modules['PiCamera']()
             self.camera.resolution = (320, 240)  # 降低解析度提升效能
             self.camera.framerate = 10  # 降低幀率
+            
+            # 由 ISP 以硬體裁切 ROI，只傳回 ROI 範圍的畫面
+            x, y, w, h = self.ROI
+            width, height = self.camera.resolution
+            self.camera.zoom = (x / width, y / height, w / width, h / height)
             self.camera.start_preview()
             time.sleep(2)
             
-            # 初始化緩衝區
-            self.buffer = self.modules['deque'](maxlen=self.BUFFER_SIZE)
+            # libjpeg-turbo 編碼器 (NEON SIMD)，取代 PIL 的 JPEG 編碼
+            self.jpeg = self.modules['TurboJPEG']()
+            # libjpeg-turbo 編碼時會釋放 GIL，事件影格可在多核心上平行編碼
+            self.encode_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+            
+            # 初始化環形緩衝區，攝影機直接寫入各個槽位
+            # 未編碼擷取的寬補齊至 32、高補齊至 16 的倍數
+            np = self.modules['np']
+            self._frames = np.empty((self.BUFFER_SIZE, (h + 15) // 16 * 16, (w + 31) // 32 * 32, 3),
+                                    dtype=np.uint8)
+            self._ts = np.zeros(self.BUFFER_SIZE, dtype=np.int64)  # epoch 秒，保存時才格式化
+            self._smoke = np.zeros(self.BUFFER_SIZE, dtype=bool)
+            self._fire = np.zeros(self.BUFFER_SIZE, dtype=bool)
+            
+            # 感測器滑動視窗，過濾單次雜訊觸發
+            self._smoke_hist = np.zeros(self.SENSOR_WINDOW, dtype=np.uint8)
+            self._fire_hist = np.zeros(self.SENSOR_WINDOW, dtype=np.uint8)
+            self._hist_i = 0
+            
+            # 警報冷卻狀態，以事件編號索引
+            self.last_alert_time = np.zeros(len(self.EVENT_IDS), dtype=np.float64)
+            
+            # 熱路徑不產生循環參照，停用自動分代回收，只在事件保存與清理後手動回收
+            gc.disable()
             
             # 啟動郵件發送執行緒
             self.start_email_thread()
@@ -312,61 +367,66 @@ class OptimizedMonitorSystem:
             return False
     
     def start_email_thread(self):
-        """啟動郵件發送執行緒"""
+        """啟動郵件發送執行緒（同時負責定期儲存空間清理）"""
         def email_worker():
+            next_cleanup = time.monotonic()  # 啟動後先清理一次
             while running:
                 try:
                     email_data = self.email_queue.get(timeout=5)
                     if email_data is None:  # 結束信號
                         break
-                    self._send_email_sync(email_data)
-                    self.email_queue.task_done()
+                    batch, stop = self._collect_email_batch(email_data)
+                    self._send_email_sync(batch)
+                    for _ in batch:
+                        self.email_queue.task_done()
+                    if stop:
+                        break
                 except queue.Empty:
+                    now = time.monotonic()
+                    # 閒置過久則關閉連線，避免伺服器端逾時
+                    if self.smtp and now - self.smtp_last_used >= self.smtp_idle_timeout:
+                        self._close_smtp()
+                    # 佇列閒置時執行定期清理，不另開執行緒
+                    if now >= next_cleanup:
+                        self.storage_manager.perform_cleanup()
+                        next_cleanup = now + self.cleanup_interval
                     continue
                 except Exception as e:
                     logger.error(f"郵件發送執行緒錯誤: {e}")
+            self._close_smtp()
         
         self.email_thread = threading.Thread(target=email_worker, daemon=True)
         self.email_thread.start()
     
-    def capture_roi_optimized(self):
-        """優化的 ROI 擷取"""
-        try:
-            stream = self.modules['io'].BytesIO()
-            self.camera.capture(stream, format='jpeg', quality=self.IMAGE_QUALITY)
-            stream.seek(0)
-            
-            # 直接裁切，避免完整解碼
-            img = self.modules['Image'].open(stream)
-            x, y, w, h = self.ROI
-            
-            # 先裁切再轉換，減少記憶體使用
-            roi_img = img.crop((x, y, x + w, y + h))
-            roi_array = self.modules['np'].array(roi_img)
-            
-            # 手動清理
-            img.close()
-            del img
-            roi_img.close()
-            del roi_img
-            
-            return roi_array
-            
-        except Exception as e:
-            logger.error(f"優化影像擷取失敗: {e}")
-            return None
+    def make_capture_roi(self):
+        """產生優化的 ROI 擷取函式，預先綁定攝影機方法與 ROI 尺寸，省去每次擷取的屬性查詢"""
+        capture = self.camera.capture
+        _, _, w, h = self.ROI
+        size = (w, h)
+        
+        def capture_roi_optimized(slot):
+            try:
+                # 直接擷取 ROI 大小的 RGB 畫面到環形緩衝區槽位，省去 JPEG 編碼與 PIL 解碼
+                capture(slot, 'rgb', resize=size, use_video_port=True)
+                return slot[:h, :w]
+                
+            except Exception as e:
+                logger.error(f"優化影像擷取失敗: {e}")
+                return None
+        
+        return capture_roi_optimized
     
     def should_send_alert(self, event_type):
         """檢查是否應該發送警報（防止重複）"""
+        i = self.EVENT_IDS[event_type]
         current_time = time.time()
-        last_time = self.last_alert_time.get(event_type, 0)
         
-        if current_time - last_time >= self.ALERT_COOLDOWN:
-            self.last_alert_time[event_type] = current_time
+        if current_time - self.last_alert_time[i] >= self.ALERT_COOLDOWN:
+            self.last_alert_time[i] = current_time
             return True
         return False
     
-    def queue_alert_email(self, event_type, zip_bytes):
+    def queue_alert_email(self, event_type, zip_path):
         """將警報郵件加入佇列"""
         if not self.should_send_alert(event_type):
             logger.info(f"跳過重複警報: {event_type}")
@@ -375,7 +435,7 @@ class OptimizedMonitorSystem:
         try:
             email_data = {
                 'event_type': event_type,
-                'zip_bytes': zip_bytes.getvalue(),
+                'zip_path': zip_path,
                 'timestamp': datetime.now().isoformat()
             }
             self.email_queue.put_nowait(email_data)
@@ -383,75 +443,145 @@ class OptimizedMonitorSystem:
         except queue.Full:
             logger.warning("郵件佇列已滿，跳過此次警報")
     
-    def _send_email_sync(self, email_data):
-        """同步發送郵件"""
+    def _ensure_smtp(self):
+        """取得已登入的 SMTP 連線，必要時重新建立"""
+        if self.smtp is not None:
+            try:
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except Exception:
+                pass
+            self._close_smtp()
+        
+        server = self.modules['smtplib'].SMTP(self.smtp_config['HOST'], self.smtp_config['PORT'], timeout=30)
+        try:
+            server.starttls()
+            server.login(self.smtp_config['USER'], self.smtp_config['PASS'])
+        except Exception:
+            server.close()
+            raise
+        self.smtp = server
+        return server
+    
+    def _close_smtp(self):
+        """關閉 SMTP 連線"""
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+        self.smtp = None
+    
+    def _collect_email_batch(self, first):
+        """在合併時間窗內取出後續警報，一併以單封郵件發送
+        
+        Returns:
+            (警報列表, 是否收到結束信號)
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.email_batch_window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return batch, False
+            try:
+                email_data = self.email_queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, False
+            if email_data is None:
+                return batch, True
+            batch.append(email_data)
+    
+    def _send_email_sync(self, batch):
+        """同步發送郵件（同一批警報合併為一封）"""
         try:
             if not all(self.smtp_config.values()):
                 logger.warning("SMTP 設定不完整，跳過郵件發送")
                 return
-                
-            event_type = email_data['event_type']
-            zip_bytes = email_data['zip_bytes']
-            timestamp = email_data['timestamp']
+            
+            event_types = ", ".join(dict.fromkeys(d['event_type'] for d in batch))
+            timestamp = batch[0]['timestamp']
             
             msg = self.modules['MIMEMultipart']()
-            msg["Subject"] = f"[NCCU 機房警報] {event_type} - {timestamp}"
+            msg["Subject"] = f"[NCCU 機房警報] {event_types} - {timestamp}"
             msg["From"] = self.smtp_config['USER']
             msg["To"] = self.smtp_config['ALERT_TO']
             
-            body = f"NCCU 機房監控系統於 {timestamp} 偵測到 {event_type}，請立即檢查！\n\n附件包含事件發生時的影像記錄。"
+            lines = [f"NCCU 機房監控系統於 {d['timestamp']} 偵測到 {d['event_type']}，請立即檢查！" for d in batch]
+            body = "\n".join(lines) + "\n\n附件包含事件發生時的影像記錄。"
             msg.attach(self.modules['MIMEText'](body, "plain"))
             
-            # 附加 ZIP 檔案
-            part = self.modules['MIMEBase']("application", "zip")
-            part.set_payload(zip_bytes)
-            self.modules['encoders'].encode_base64(part)
-            part.add_header("Content-Disposition", f'attachment; filename="{event_type}_alert.zip"')
-            msg.attach(part)
-            
-            # 發送郵件
-            with self.modules['smtplib'].SMTP(self.smtp_config['HOST'], self.smtp_config['PORT']) as server:
-                server.starttls()
-                server.login(self.smtp_config['USER'], self.smtp_config['PASS'])
-                server.send_message(msg)
+            # 附加 ZIP 檔案，發送時才從磁碟讀取
+            # 以 mmap 直接對檔案內容做 base64，不在記憶體中另存一份原始 ZIP
+            for email_data in batch:
+                part = self.modules['MIMEBase']("application", "zip")
+                with open(email_data['zip_path'], 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    part.set_payload(base64.encodebytes(mm).decode('ascii'))
+                part['Content-Transfer-Encoding'] = 'base64'
+                part.add_header("Content-Disposition",
+                                f'attachment; filename="{email_data["event_type"]}_alert.zip"')
+                msg.attach(part)
+            
+            # 發送郵件（沿用既有連線，省去每次 TCP/TLS 握手與登入）
+            self._ensure_smtp().send_message(msg)
+            self.smtp_last_used = time.monotonic()
                 
-            logger.info(f"警報郵件發送成功: {event_type}")
+            logger.info(f"警報郵件發送成功: {event_types}")
             
         except Exception as e:
             logger.error(f"郵件發送失敗: {e}")
     
-    def save_event_optimized(self, event_type, entries):
+    @staticmethod
+    def _fmt_ts(epoch):
+        """將 epoch 秒格式化為檔名用的時間字串"""
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(epoch))
+    
+    def _buffered_slots(self):
+        """依時間順序（舊到新）列出環形緩衝區中的槽位"""
+        start = self._head - self._count
+        return [(start + i) % self.BUFFER_SIZE for i in range(self._count)]
+    
+    def save_event_optimized(self, event_type):
         """優化的事件保存"""
         try:
-            timestamp = entries[-1]['ts'].replace(' ', 'T')
+            _, _, w, h = self.ROI
+            slots = self._buffered_slots()
+            timestamp = self._fmt_ts(self._ts[slots[-1]])
             zip_path = os.path.join(self.OUT_DIR, f"{event_type}_{timestamp}.zip")
             
-            # 建立記憶體 ZIP
-            with self.modules['io'].BytesIO() as buf:
-                with self.modules['zipfile'].ZipFile(buf, "w", compression=self.modules['zipfile'].ZIP_DEFLATED) as zf:
-                    for i, e in enumerate(entries):
-                        fn = f"{event_type}_{i+1}_{e['ts'].replace(' ', 'T')}.jpg"
-                        
-                        # 直接從 numpy array 壓縮為 JPEG
-                        im = self.modules['Image'].fromarray(e["img"])
-                        with self.modules['io'].BytesIO() as img_buf:
-                            im.save(img_buf, format="JPEG", quality=self.IMAGE_QUALITY, optimize=True)
-                            zf.writestr(fn, img_buf.getvalue())
-                        im.close()
-                        del im
-                
-                # 同時保存到磁碟（使用相同的 ZIP 資料）
-                with open(zip_path, 'wb') as f:
-                    f.write(buf.getvalue())
+            # 直接寫入同目錄的暫存檔，不在記憶體中另建一份 ZIP；完成後原子性更名
+            # JPEG 已是壓縮格式，DEFLATE 幾乎無效益，直接以 STORED 模式封裝
+            # 以 1 MB 緩衝寫入，整個事件的 ZIP 通常只需一兩次 write 系統呼叫
+            tmp_path = f"{zip_path}.tmp"
+            with open(tmp_path, 'wb', buffering=1024 * 1024) as f, \
+                    self.modules['zipfile'].ZipFile(f, "w", compression=self.modules['zipfile'].ZIP_STORED) as zf:
+                # 直接從槽位的 numpy view 壓縮為 JPEG（依列間距讀取，不需複製）
+                encoded = self.encode_pool.map(
+                    lambda slot: self.jpeg.encode(self._frames[slot, :h, :w], quality=self.IMAGE_QUALITY,
+                                                  pixel_format=self.modules['TJPF_RGB']),
+                    slots
+                )
+                # 依原順序寫入 ZIP，寫入與其餘影格的編碼同時進行
+                # 以 ZipInfo 直接帶入擷取時間，不需由 writestr 逐筆查詢目前時間
+                for i, (slot, jpeg_bytes) in enumerate(zip(slots, encoded)):
+                    fn = f"{event_type}_{i+1}_{self._fmt_ts(self._ts[slot])}.jpg"
+                    zinfo = self.modules['zipfile'].ZipInfo(fn, date_time=time.localtime(self._ts[slot])[:6])
+                    zinfo.compress_type = self.modules['zipfile'].ZIP_STORED
+                    zf.writestr(zinfo, jpeg_bytes)
+            
+            os.rename(tmp_path, zip_path)
+            
+            # 非同步發送警報，佇列中只放檔案路徑
+            self.queue_alert_email(event_type, zip_path)
                 
-                # 非同步發送警報
-                buf.seek(0)
-                self.queue_alert_email(event_type, buf)
-                
-            logger.info(f"事件已優化保存: {event_type} - {len(entries)} 張影像")
+            logger.info(f"事件已優化保存: {event_type} - {len(slots)} 張影像")
             
         except Exception as e:
             logger.error(f"事件保存失敗: {e}")
+        finally:
+            gc.collect()
     
     def monitor_loop(self):
         """優化的主要監控迴圈"""
@@ -459,13 +589,20 @@ class OptimizedMonitorSystem:
         
         logger.info("開始優化監控...")
         
+        # 迴圈內常用的方法與物件先綁定為區域變數
+        capture_roi = self.make_capture_roi()
+        frames = self._frames
+        read_pin = type(self.mq2).value.fget
+        mq2, flame = self.mq2, self.flame
+        
         while running:
             try:
-                # 取得時間戳記
-                ts = datetime.now().isoformat(sep=" ", timespec="seconds")
+                # 取得時間戳記（epoch 秒）
+                ts = int(time.time())
                 
                 # 擷取影像
-                roi = self.capture_roi_optimized()
+                slot = self._head
+                roi = capture_roi(frames[slot])
                 if roi is None:
                     time.sleep(1)
                     continue
@@ -474,24 +611,28 @@ class OptimizedMonitorSystem:
                 self.performance_monitor.update_frame_count()
                 
                 # 讀取感測器
-                smoke = not self.mq2.value
-                fire = not self.flame.value
+                smoke = not read_pin(mq2)
+                fire = not read_pin(flame)
                 
-                # 建立記錄
-                entry = {"ts": ts, "img": roi, "smoke": smoke, "fire": fire}
-                self.buffer.append(entry)
+                # 寫入記錄
+                self._ts[slot] = ts
+                self._smoke[slot] = smoke
+                self._fire[slot] = fire
+                self._head = (slot + 1) % self.BUFFER_SIZE
+                self._count = min(self._count + 1, self.BUFFER_SIZE)
                 
-                # 檢查警報條件
-                if smoke or fire:
-                    event_type = "SMOKE" if smoke else "FIRE"
-                    logger.warning(f"偵測到 {event_type}！正在保存記錄...")
-                    self.save_event_optimized(event_type, list(self.buffer))
+                # 更新滑動視窗
+                self._smoke_hist[self._hist_i] = smoke
+                self._fire_hist[self._hist_i] = fire
+                self._hist_i = (self._hist_i + 1) % self.SENSOR_WINDOW
                 
-                # 定期清理儲存空間（每小時）
-                current_time = time.time()
-                if current_time - self.last_cleanup_time > 3600:
-                    threading.Thread(target=self.storage_manager.perform_cleanup, daemon=True).start()
-                    self.last_cleanup_time = current_time
+                # 檢查警報條件：視窗內觸發次數達門檻才視為事件
+                smoke_event = smoke and self._smoke_hist.sum() >= self.SENSOR_THRESHOLD
+                fire_event = fire and self._fire_hist.sum() >= self.SENSOR_THRESHOLD
+                if smoke_event or fire_event:
+                    event_type = "SMOKE" if smoke_event else "FIRE"
+                    logger.warning(f"偵測到 {event_type}！正在保存記錄...")
+                    self.save_event_optimized(event_type)
                 
                 # 效能報告（每分鐘）
                 fps = self.performance_monitor.get_fps()
@@ -499,10 +640,6 @@ class OptimizedMonitorSystem:
                     uptime = self.performance_monitor.get_uptime()
                     logger.info(f"效能報告 - FPS: {fps:.1f}, 運行時間: {uptime/3600:.1f}h, 總幀數: {self.performance_monitor.frame_count}")
                 
-                # 記憶體清理
-                if self.performance_monitor.frame_count % 100 == 0:
-                    gc.collect()
-                
                 time.sleep(self.CAP_INTERVAL)
                 
             except KeyboardInterrupt:
@@ -521,6 +658,9 @@ class OptimizedMonitorSystem:
                 self.email_queue.put(None)  # 結束信號
                 self.email_thread.join(timeout=5)
             
+            if self.encode_pool:
+                self.encode_pool.shutdown(wait=True)
+            
             if self.camera:
                 self.camera.close()
                 logger.info("攝影機已關閉")
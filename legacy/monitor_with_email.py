@@ -1,16 +1,35 @@
 #!/usr/bin/env python3
-import os, time, io, zipfile, smtplib
-from collections import deque
+import os, sys, time, io, zipfile, smtplib, threading, queue, logging, shutil
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
+from email.mime.application import MIMEApplication
 from email.mime.text import MIMEText
-from email import encoders
 from picamera import PiCamera
-from PIL import Image
 import board, digitalio
 from dotenv import load_dotenv
 import numpy as np
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    jpeg = TurboJPEG()
+except (ImportError, RuntimeError):
+    jpeg = None  # fall back to PIL if libjpeg-turbo is unavailable
+    from PIL import Image
+
+# logging: the loop only enqueues records, a listener thread does the file/stdout writes
+os.makedirs("logs", exist_ok=True)
+log_queue = queue.Queue(-1)
+log_format = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+file_handler = RotatingFileHandler("logs/monitor_with_email.log", maxBytes=5_000_000, backupCount=5)
+stream_handler = logging.StreamHandler(sys.stdout)
+for h in (file_handler, stream_handler):
+    h.setFormatter(log_format)
+log_listener = QueueListener(log_queue, file_handler, stream_handler)
+log_listener.start()
+logger = logging.getLogger("monitor_with_email")
+logger.setLevel(logging.INFO)
+logger.addHandler(QueueHandler(log_queue))
 
 # load SMTP settings from .env
 load_dotenv()
@@ -25,79 +44,190 @@ BUFFER_SIZE  = 20
 CAP_INTERVAL = 5
 ROI = (100, 80, 200, 150)
 OUT_DIR = "captures"
+KEEP_INDIVIDUAL_FILES = os.getenv("DEBUG_KEEP_INDIVIDUAL_FILES", "0") == "1"
+# require a red-dominant ROI before counting a flame reading (off by default)
+FIRE_IMAGE_CUE = os.getenv("FIRE_IMAGE_CUE", "0") == "1"
+
+# alert mail templates, filled in per event
+MAIL_SUBJECT = "[Alert] {event_type} detected at {time}"
+MAIL_BODY = "{event_type} detected. Attached is last {count} frames."
 os.makedirs(OUT_DIR, exist_ok=True)
 
 # setup sensors and camera
 mq2 = digitalio.DigitalInOut(board.D17); mq2.direction = digitalio.Direction.INPUT
 flame = digitalio.DigitalInOut(board.D27); flame.direction = digitalio.Direction.INPUT
+# unbound property getter, so each tick skips the descriptor lookup
+read_pin = type(mq2).value.fget
+
+def read_sensors():
+    # both sensors are active-low
+    return not read_pin(mq2), not read_pin(flame)
+
 camera = PiCamera()
 camera.resolution = (640, 480)
+# crop to the ROI in the GPU ISP so only ROI pixels are transferred
+camera.zoom = (ROI[0] / 640, ROI[1] / 480, ROI[2] / 640, ROI[3] / 480)
 camera.start_preview()
 time.sleep(2)
 
-buffer = deque(maxlen=BUFFER_SIZE)
+# ring buffer of the last BUFFER_SIZE frames, allocated once:
+# head is the next slot to write, filled the number of valid slots.
+# slots are sized for the raw capture, which pads width to a multiple
+# of 32 and height to 16, so the camera writes straight into them
+PAD_H, PAD_W = (ROI[3] + 15) // 16 * 16, (ROI[2] + 31) // 32 * 32
+img_ring = np.empty((BUFFER_SIZE, PAD_H, PAD_W, 3), dtype=np.uint8)
+ts_ring = np.zeros(BUFFER_SIZE, dtype=np.int64)  # epoch seconds
+smoke_ring = np.zeros(BUFFER_SIZE, dtype=bool)
+fire_ring = np.zeros(BUFFER_SIZE, dtype=bool)
+head = 0
+filled = 0
+
+smtp = None  # logged-in SMTP session, reused across alerts
+
+# encode/zip/mail runs on one worker thread so sampling never stalls;
+# at most MAX_PENDING_EVENTS are queued, further events are dropped
+MAX_PENDING_EVENTS = 4
+MIN_FREE_BYTES = 100 * 1024 * 1024  # drop events when the SD card is nearly full
+event_pool = ThreadPoolExecutor(max_workers=1)
+event_slots = threading.Semaphore(MAX_PENDING_EVENTS)
+
+def capture_roi(slot):
+    _, _, w, h = ROI
+    camera.capture(slot, format='rgb', resize=(w, h), use_video_port=True)
+    return slot[:h, :w]  # view, no copy
+
+def fire_cue(roi):
+    # per-channel means in one vectorized pass over the ROI
+    r, g, b = roi.mean(axis=(0, 1))
+    return r > 1.4 * g and r > 1.4 * b and r > 120
+
+def snapshot():
+    # oldest to newest; fancy indexing copies the frames so the
+    # worker thread is not affected by later captures
+    order = np.arange(head - filled, head) % BUFFER_SIZE
+    return ts_ring[order], img_ring[order, :ROI[3], :ROI[2]]
+
+def fmt_ts(t):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t))
 
-def capture_roi():
-    stream = io.BytesIO()
-    camera.capture(stream, format='jpeg')
-    stream.seek(0)
-    img = Image.open(stream).convert("RGB")
-    np_img = np.array(img)
-    x, y, w, h = ROI
-    roi = np_img[y:y+h, x:x+w].copy()
-    return roi
+def encode_jpeg(img):
+    if jpeg is not None:
+        return jpeg.encode(img, quality=85, pixel_format=TJPF_RGB)
+    with io.BytesIO() as img_buf:
+        Image.fromarray(img).save(img_buf, format="JPEG", quality=85)
+        return img_buf.getvalue()
 
-def send_event_email(event_type, zip_bytes):
+def get_smtp():
+    global smtp
+    if smtp is not None:
+        try:
+            if smtp.noop()[0] == 250:
+                return smtp
+        except (smtplib.SMTPException, OSError):
+            pass
+        close_smtp()
+    s = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+    try:
+        s.starttls()
+        s.login(SMTP_USER, SMTP_PASS)
+    except Exception:
+        s.close()
+        raise
+    smtp = s
+    return smtp
+
+def close_smtp():
+    global smtp
+    if smtp is not None:
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+        smtp = None
+
+def send_event_email(event_type, zip_bytes, count):
     msg = MIMEMultipart()
-    msg["Subject"] = f"[Alert] {event_type} detected at {datetime.now().isoformat()}"
+    msg["Subject"] = MAIL_SUBJECT.format(event_type=event_type, time=datetime.now().isoformat())
     msg["From"] = SMTP_USER
     msg["To"] = ALERT_TO
-    msg.attach(MIMEText(f"{event_type} detected. Attached is last {len(buffer)} frames.", "plain"))
-    part = MIMEBase("application", "zip")
-    part.set_payload(zip_bytes.getvalue())
-    encoders.encode_base64(part)
+    msg.attach(MIMEText(MAIL_BODY.format(event_type=event_type, count=count), "plain"))
+    # MIMEApplication base64-encodes the raw ZIP bytes in one pass
+    part = MIMEApplication(zip_bytes, _subtype="zip")
     part.add_header("Content-Disposition", f'attachment; filename="{event_type}.zip"')
     msg.attach(part)
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-        s.starttls()
-        s.login(SMTP_USER, SMTP_PASS)
-        s.send_message(msg)
-
-def save_event(event_type, entries):
-    zip_path = os.path.join(OUT_DIR, f"{event_type}_{entries[-1]['ts'].replace(' ', 'T')}.zip")
-    with zipfile.ZipFile(zip_path, "w") as zf:
-        for i, e in enumerate(entries):
-            fn = f"{event_type}_{i+1}_{e['ts'].replace(' ', 'T')}.jpg"
-            img_path = os.path.join(OUT_DIR, fn)
-            Image.fromarray(e["img"]).save(img_path)
-            zf.write(img_path, arcname=fn)
+    try:
+        get_smtp().send_message(msg)
+    except (smtplib.SMTPServerDisconnected, OSError):
+        # stale session: reconnect once and resend
+        close_smtp()
+        get_smtp().send_message(msg)
+
+def save_event(event_type, timestamps, images):
+    # encode each frame once and build a single archive; the same bytes
+    # are mailed and written to disk.
+    # ZIP_STORED on purpose: deflate gains <1% on JPEG data
+    encoded = [(f"{event_type}_{i+1}_{fmt_ts(t)}.jpg", encode_jpeg(img))
+               for i, (t, img) in enumerate(zip(timestamps, images))]
     with io.BytesIO() as buf:
-        with zipfile.ZipFile(buf, "w") as zf:
-            for i, e in enumerate(entries):
-                fn = f"{event_type}_{i+1}_{e['ts'].replace(' ', 'T')}.jpg"
-                im = Image.fromarray(e["img"])
-                with io.BytesIO() as img_buf:
-                    im.save(img_buf, format="JPEG")
-                    zf.writestr(fn, img_buf.getvalue())
-        buf.seek(0)
-        send_event_email(event_type, buf)
-
-print(f"Monitoring... buffer size={BUFFER_SIZE}, interval={CAP_INTERVAL}s")
+        with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED, allowZip64=False) as zf:
+            for fn, data in encoded:
+                zf.writestr(fn, data)
+        zip_bytes = buf.getvalue()
+    # mail first so the alert is not held up by SD-card writes;
+    # the on-disk archive is written even if sending fails
+    try:
+        send_event_email(event_type, zip_bytes, len(encoded))
+    finally:
+        zip_path = os.path.join(OUT_DIR, f"{event_type}_{fmt_ts(timestamps[-1])}.zip")
+        with open(zip_path, "wb") as f:
+            f.write(zip_bytes)
+        if KEEP_INDIVIDUAL_FILES:
+            for fn, data in encoded:
+                with open(os.path.join(OUT_DIR, fn), "wb") as f:
+                    f.write(data)
+
+def event_done(future):
+    event_slots.release()
+    if future.exception() is not None:
+        logger.error(f"event handling failed: {future.exception()}")
+
+def dispatch_event(event_type):
+    if shutil.disk_usage(OUT_DIR).free < MIN_FREE_BYTES:
+        logger.warning(f"{event_type} event dropped, less than {MIN_FREE_BYTES // (1024 * 1024)} MB free")
+        return
+    if not event_slots.acquire(blocking=False):
+        logger.warning(f"{event_type} event dropped, {MAX_PENDING_EVENTS} events still pending")
+        return
+    timestamps, images = snapshot()
+    event_pool.submit(save_event, event_type, timestamps, images).add_done_callback(event_done)
+
+tick_count = 0
+
+logger.info(f"Monitoring... buffer size={BUFFER_SIZE}, interval={CAP_INTERVAL}s")
 try:
     while True:
-        ts = datetime.now().isoformat(sep=" ", timespec="seconds")
-        roi = capture_roi()
-        smoke = not mq2.value
-        fire  = not flame.value
-        entry = {"ts": ts, "img": roi, "smoke": smoke, "fire": fire}
-        buffer.append(entry)
-        print(f"[{ts}] smoke={smoke} fire={fire}")
+        ts = int(time.time())
+        roi = capture_roi(img_ring[head])
+        smoke, fire = read_sensors()
+        if fire and FIRE_IMAGE_CUE:
+            fire = fire_cue(roi)
+        ts_ring[head] = ts
+        smoke_ring[head] = smoke
+        fire_ring[head] = fire
+        head = (head + 1) % BUFFER_SIZE
+        filled = min(filled + 1, BUFFER_SIZE)
+        tick_count += 1
+        if smoke or fire or tick_count % 10 == 0:
+            logger.info(f"smoke={smoke} fire={fire}")
         if smoke or fire:
             ev = "SMOKE" if smoke else "FIRE"
-            print(f">>> {ev} event! saving and emailing buffer...")
-            save_event(ev, list(buffer))
+            logger.warning(f"{ev} event! saving and emailing buffer...")
+            dispatch_event(ev)
         time.sleep(CAP_INTERVAL)
 except KeyboardInterrupt:
-    print("Stopped.")
+    logger.info("Stopped.")
 finally:
+    event_pool.shutdown(wait=True)
+    close_smtp()
     camera.close()
+    log_listener.stop()
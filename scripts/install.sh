@@ -61,6 +61,7 @@ install_system_dependencies() {
         build-essential \
         libatlas-base-dev \
         libjpeg-dev \
+        libturbojpeg0 \
         zlib1g-dev \
         libfreetype6-dev \
         liblcms2-dev \
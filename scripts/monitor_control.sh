@@ -178,7 +178,7 @@ health_check() {
     # 檢查 Python 套件
     python3 -c "
 import sys
-packages = ['picamera', 'PIL', 'board', 'digitalio', 'dotenv', 'numpy']
+packages = ['picamera', 'PIL', 'board', 'digitalio', 'gpiod', 'turbojpeg', 'dotenv', 'numpy']
 missing = []
 for pkg in packages:
     try:
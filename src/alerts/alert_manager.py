@@ -6,22 +6,33 @@ email notifications with attachments.
 """
 
 import asyncio
+import heapq
 import io
+import itertools
 import logging
+import queue
 import smtplib
+import socket
+import string
+import time
 import zipfile
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from email import encoders
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from email.message import EmailMessage, MIMEPart
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from secrets import token_hex
+from typing import Any, Deque, Dict, List, Optional, Tuple
 import json
 
 from src.core.exceptions import AlertException, EmailException
 from src.utils.logger import get_logger, log_audit_event
 
+try:
+    import orjson
+except ImportError:  # optional, listed in requirements/prod.txt
+    orjson = None
+
 
 class AlertLevel:
     """Alert severity levels."""
@@ -31,6 +42,50 @@ class AlertLevel:
     CRITICAL = "critical"
 
 
+# Severity order used to pick the headline level of a batched email
+_LEVEL_RANK = {
+    AlertLevel.INFO: 0,
+    AlertLevel.WARNING: 1,
+    AlertLevel.ERROR: 2,
+    AlertLevel.CRITICAL: 3
+}
+
+# 根據警報等級設定主旨前綴
+_LEVEL_PREFIX = {
+    AlertLevel.INFO: "[INFO]",
+    AlertLevel.WARNING: "[WARNING]",
+    AlertLevel.ERROR: "[ERROR]",
+    AlertLevel.CRITICAL: "[CRITICAL]"
+}
+
+_SEPARATOR = "=" * 50
+
+_BODY_TEMPLATE = string.Template(f"""\
+NCCU Server Room Monitoring System Alert
+{_SEPARATOR}
+
+Alert Type: $alert_type
+Severity: $level
+Time: $time
+Source: $source
+
+Message:
+$message
+
+{_SEPARATOR}
+Location: NCCU Building 1F Server Room
+System: Monitoring System v2.0
+
+Action Required: Please investigate this alert immediately.
+
+Contact:
+- IT Department: (02) 2939-3091
+- Emergency: 0958-242-580
+
+{_SEPARATOR}
+This is an automated message from the NCCU monitoring system.""")
+
+
 class Alert:
     """Represents a single alert."""
     
@@ -40,7 +95,8 @@ class Alert:
         message: str,
         level: str = AlertLevel.WARNING,
         source: Optional[str] = None,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        timestamp: Optional[datetime] = None
     ):
         """Initialize alert.
         
@@ -50,6 +106,7 @@ class Alert:
             level: Alert severity level
             source: Source of the alert
             metadata: Additional alert metadata
+            timestamp: Creation time, defaults to now
         """
         self.alert_id = self._generate_id()
         self.alert_type = alert_type
@@ -57,7 +114,7 @@ class Alert:
         self.level = level
         self.source = source or "system"
         self.metadata = metadata or {}
-        self.timestamp = datetime.now()
+        self.timestamp = timestamp or datetime.now()
         self.sent = False
         self.sent_time: Optional[datetime] = None
         self.recipients: List[str] = []
@@ -65,8 +122,7 @@ class Alert:
         
     def _generate_id(self) -> str:
         """Generate unique alert ID."""
-        import uuid
-        return str(uuid.uuid4())[:8]
+        return token_hex(4)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert alert to dictionary."""
@@ -85,24 +141,163 @@ class Alert:
         }
 
 
+class SMTPPool:
+    """Fixed-size pool of persistent, logged-in SMTP sessions.
+    
+    Sessions are opened lazily on first use, validated with NOOP before
+    reuse, and recycled after ``MAX_MESSAGES_PER_CONN`` messages. All
+    methods are blocking and meant to run on executor threads.
+    """
+    
+    MAX_MESSAGES_PER_CONN = 100
+    
+    def __init__(self, config: Any, size: int):
+        """Initialize SMTP pool.
+        
+        Args:
+            config: Configuration object with SMTP settings
+            size: Maximum number of concurrent SMTP sessions
+        """
+        self.config = config
+        self.size = size
+        # smtplib calls socket.getfqdn() for every new session when no
+        # local hostname is given; that DNS lookup can stall for seconds
+        self._local_hostname = config.smtp.local_hostname or socket.getfqdn()
+        # Each slot holds None (not connected) or [connection, messages_sent]
+        self._slots: queue.Queue = queue.Queue()
+        for _ in range(size):
+            self._slots.put(None)
+    
+    def send(self, msg: EmailMessage, recipients: List[str]):
+        """Send a message on a pooled session.
+        
+        Blocks until a session slot is free. Reconnects once if the
+        server dropped the session.
+        
+        Args:
+            msg: Email message
+            recipients: List of recipients
+        """
+        slot = self._slots.get()
+        entry = None
+        try:
+            entry = self._ready(slot)
+            try:
+                entry[0].send_message(msg, to_addrs=recipients)
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError):
+                self._discard(entry)
+                entry = None
+                entry = self._ready(None)
+                entry[0].send_message(msg, to_addrs=recipients)
+            
+            entry[1] += 1
+            if entry[1] >= self.MAX_MESSAGES_PER_CONN:
+                self._quit(entry)
+                entry = None
+        finally:
+            self._slots.put(entry)
+    
+    def close(self):
+        """Close all idle sessions."""
+        for _ in range(self.size):
+            try:
+                entry = self._slots.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                self._quit(entry)
+            self._slots.put(None)
+    
+    def _ready(self, entry: Optional[list]) -> list:
+        """Return a usable session entry, reconnecting if it is stale."""
+        if entry is not None:
+            try:
+                if entry[0].noop()[0] == 250:
+                    return entry
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard(entry)
+        return [self._connect(), 0]
+    
+    def _connect(self) -> smtplib.SMTP:
+        """Open and authenticate a new SMTP session.
+        
+        Returns:
+            Logged-in SMTP connection
+        """
+        server = smtplib.SMTP(
+            self.config.smtp.host,
+            self.config.smtp.port,
+            local_hostname=self._local_hostname,
+            timeout=self.config.smtp.timeout
+        )
+        try:
+            if self.config.smtp.use_tls:
+                server.starttls()
+            server.login(
+                self.config.smtp.user,
+                self.config.smtp.password.get_secret_value()
+            )
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    @staticmethod
+    def _quit(entry: list):
+        """Politely end a session, falling back to closing the socket."""
+        try:
+            entry[0].quit()
+        except (smtplib.SMTPException, OSError):
+            SMTPPool._discard(entry)
+    
+    @staticmethod
+    def _discard(entry: list):
+        """Close a session without a QUIT round trip."""
+        try:
+            entry[0].close()
+        except OSError:
+            pass
+
+
 class EmailSender:
     """Handles email sending for alerts."""
     
-    def __init__(self, config: Any):
+    def __init__(self, config: Any, executor: Optional[ThreadPoolExecutor] = None):
         """Initialize email sender.
         
         Args:
             config: Configuration object with SMTP settings
+            executor: Executor for blocking SMTP calls; a private one sized
+                to the SMTP pool is created when omitted
         """
         self.config = config
         self.logger = get_logger(__name__)
         
+        # Persistent SMTP sessions and one worker thread per session
+        pool_size = config.alerts.smtp_pool_size
+        self.pool = SMTPPool(config, pool_size)
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=pool_size,
+            thread_name_prefix="smtp"
+        )
+        
+        # Header values; To is rebuilt only when a different list is passed
+        self._from = config.smtp.user
+        self._to_recipients: Optional[List[str]] = None
+        self._to_header = ""
+        
+        # Last encoded ZIP part and the images it was built from
+        self._zip_cache: Optional[tuple] = None
+        
     async def send_email(
         self,
         recipients: List[str],
         subject: str,
         body: str,
-        attachments: Optional[List[bytes]] = None
+        attachments: Optional[List[bytes]] = None,
+        timestamp: Optional[datetime] = None
     ) -> bool:
         """Send email alert.
         
@@ -111,22 +306,27 @@ class EmailSender:
             subject: Email subject
             body: Email body
             attachments: Optional list of attachment data
+            timestamp: Time used in attachment names, defaults to now
             
         Returns:
             True if email sent successfully
         """
         try:
-            msg = MIMEMultipart()
-            msg["From"] = self.config.smtp.user
-            msg["To"] = ", ".join(recipients)
+            if recipients is not self._to_recipients:
+                self._to_recipients = recipients
+                self._to_header = ", ".join(recipients)
+            
+            msg = EmailMessage()
+            msg["From"] = self._from
+            msg["To"] = self._to_header
             msg["Subject"] = subject
             
             # Add body
-            msg.attach(MIMEText(body, "plain", "utf-8"))
+            msg.set_content(body)
             
             # Add attachments
             if attachments:
-                self._add_attachments(msg, attachments)
+                self._add_attachments(msg, attachments, timestamp or datetime.now())
             
             # Send email
             await self._send_smtp(msg, recipients)
@@ -138,64 +338,98 @@ class EmailSender:
             self.logger.error(f"Failed to send email: {e}")
             raise EmailException(f"Email sending failed: {e}", recipients=recipients)
     
-    def _add_attachments(self, msg: MIMEMultipart, attachments: List[bytes]):
+    def _add_attachments(
+        self,
+        msg: EmailMessage,
+        attachments: List[bytes],
+        timestamp: datetime
+    ):
         """Add attachments to email.
         
+        Alerts of different types raised together usually carry the same
+        camera buffer, so the encoded ZIP part is reused when the image
+        objects and the timestamp in the file names match the previous call.
+        
         Args:
             msg: Email message object
             attachments: List of attachment data
+            timestamp: Time used in attachment names
         """
-        # Create ZIP file with images
+        stamp = timestamp.strftime("%Y%m%d_%H%M%S")
+        cached = self._zip_cache
+        if (
+            cached is not None
+            and cached[1] == stamp
+            and len(cached[0]) == len(attachments)
+            and all(a is b for a, b in zip(cached[0], attachments))
+        ):
+            part = cached[2]
+        else:
+            part = self._build_zip_part(attachments, stamp)
+            # Holding the images keeps the identity check above valid
+            self._zip_cache = (tuple(attachments), stamp, part)
+        
+        msg.make_mixed()
+        msg.attach(part)
+    
+    def _build_zip_part(self, attachments: List[bytes], timestamp: str) -> MIMEPart:
+        """Build the base64-encoded ZIP attachment part.
+        
+        Args:
+            attachments: List of attachment data
+            timestamp: Formatted time used in attachment names
+            
+        Returns:
+            MIME part containing the ZIP archive
+        """
+        # Create ZIP file with images (JPEG is already compressed, store as-is)
         zip_buffer = io.BytesIO()
         
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_STORED) as zf:
             for i, data in enumerate(attachments):
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 filename = f"alert_image_{i:03d}_{timestamp}.jpg"
                 zf.writestr(filename, data)
         
-        zip_buffer.seek(0)
-        
-        # Attach ZIP file
-        part = MIMEBase("application", "zip")
-        part.set_payload(zip_buffer.read())
-        encoders.encode_base64(part)
-        part.add_header(
-            "Content-Disposition",
-            f"attachment; filename=alert_images_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        # ZIP attachment part (bytes content is base64-encoded once here)
+        part = MIMEPart()
+        part.set_content(
+            zip_buffer.getvalue(),
+            maintype="application",
+            subtype="zip",
+            disposition="attachment",
+            filename=f"alert_images_{timestamp}.zip"
         )
-        msg.attach(part)
+        return part
     
-    async def _send_smtp(self, msg: MIMEMultipart, recipients: List[str]):
+    async def _send_smtp(self, msg: EmailMessage, recipients: List[str]):
         """Send email via SMTP.
         
         Args:
             msg: Email message
             recipients: List of recipients
         """
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         await loop.run_in_executor(
-            None,
+            self._executor,
             self._send_smtp_sync,
             msg,
             recipients
         )
     
-    def _send_smtp_sync(self, msg: MIMEMultipart, recipients: List[str]):
+    def _send_smtp_sync(self, msg: EmailMessage, recipients: List[str]):
         """Synchronous SMTP sending.
         
         Args:
             msg: Email message
             recipients: List of recipients
         """
-        with smtplib.SMTP(self.config.smtp.host, self.config.smtp.port) as server:
-            if self.config.smtp.use_tls:
-                server.starttls()
-            server.login(
-                self.config.smtp.user,
-                self.config.smtp.password.get_secret_value()
-            )
-            server.send_message(msg, to_addrs=recipients)
+        self.pool.send(msg, recipients)
+    
+    def close(self):
+        """Wait for pending sends and close the SMTP sessions."""
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+        self.pool.close()
 
 
 class AlertManager:
@@ -209,16 +443,42 @@ class AlertManager:
         """
         self.config = config
         self.logger = get_logger(__name__)
-        self.email_sender = EmailSender(config)
+        
+        # Dedicated SMTP threads, kept off the loop's default executor
+        self._smtp_executor = ThreadPoolExecutor(
+            max_workers=config.alerts.smtp_pool_size,
+            thread_name_prefix="smtp"
+        )
+        self.email_sender = EmailSender(config, self._smtp_executor)
         
         # Alert tracking
-        self.alerts: List[Alert] = []
+        self.alerts: Deque[Alert] = deque(maxlen=config.alerts.history_size)
+        self._sent_count = 0
+        self._level_counts: Counter = Counter()
+        # Active cooldowns: last send time (for reporting), monotonic expiry,
+        # and a heap of (expiry, alert_type) to expire them in order
         self.cooldowns: Dict[str, datetime] = {}
+        self._cool_until: Dict[str, float] = {}
+        self._cool_heap: List[tuple] = []
+        
+        # Recipients are static for the lifetime of the manager
+        self._recipients: Tuple[str, ...] = tuple(config.alerts.recipients)
+        
+        # Per-type token bucket: alert_type -> (tokens, last refill)
+        self._bucket: Dict[str, tuple] = {}
+        self._bucket_rate = config.alerts.rate_limit_per_s
+        self._bucket_burst = config.alerts.rate_limit_burst
+        self._throttled_counts: Counter = Counter()
         self.alert_counts: Dict[str, int] = {}
         
-        # Alert queue
+        # Alert queue, drained in batches by _batch_worker
         self.alert_queue: asyncio.Queue = asyncio.Queue()
         self.processing = False
+        self._batch_task: Optional[asyncio.Task] = None
+        # Set by aclose() to cut the current batch window short
+        self._flush = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closed = False
         
     async def send_alert(
         self,
@@ -230,6 +490,9 @@ class AlertManager:
     ) -> bool:
         """Send an alert.
         
+        Alerts of the same type sent within ``alerts.batch_window_s`` of
+        each other are delivered together in a single email.
+        
         Args:
             alert_type: Type of alert
             message: Alert message
@@ -240,70 +503,216 @@ class AlertManager:
         Returns:
             True if alert sent successfully
         """
-        # Check cooldown
+        if self._closed:
+            self.logger.warning(f"Alert {alert_type} dropped, alert manager is closed")
+            return False
+        
+        # Get recipients based on alert level
+        recipients = self._get_recipients(level)
+        if not recipients:
+            self.logger.warning("No alert recipients configured")
+            return False
+        
+        # Check cooldown first so rejected calls do not drain the bucket
         if not self._check_cooldown(alert_type):
             self.logger.info(f"Alert {alert_type} in cooldown period")
             return False
         
-        # Create alert
+        # Flood guard for bursts arriving before the first send starts a cooldown
+        tick = time.monotonic()
+        rate = self._bucket_rate
+        tokens, last = self._bucket.get(alert_type, (self._bucket_burst, tick))
+        tokens = min(self._bucket_burst, tokens + (tick - last) * rate)
+        if tokens < 1:
+            self._throttled_counts[alert_type] += 1
+            self.logger.info(f"Alert {alert_type} throttled by rate limit")
+            return False
+        self._bucket[alert_type] = (tokens - 1, tick)
+        
+        # Create alert; its timestamp also names the attachments
+        now = datetime.now()
         alert = Alert(
             alert_type=alert_type,
             message=message,
             level=level,
-            metadata=metadata
+            metadata=metadata,
+            timestamp=now
         )
         
+        if self.config.alerts.batch_window_s <= 0:
+            return await self._deliver([(alert, images)], recipients)
+        
+        # Queue for the batch worker and wait for the batched delivery
+        self._loop = asyncio.get_running_loop()
+        future = self._loop.create_future()
+        await self.alert_queue.put((alert, images, recipients, future))
+        if self._batch_task is None or self._batch_task.done():
+            self._batch_task = asyncio.create_task(self._batch_worker())
+        return await future
+    
+    async def _batch_worker(self):
+        """Coalesce alerts queued within the batch window, one email per type.
+        
+        A ``None`` item queued by :meth:`aclose` delivers what is pending
+        and stops the worker.
+        """
+        while True:
+            first = await self.alert_queue.get()
+            if first is None:
+                return
+            batch = [first]
+            try:
+                try:
+                    await asyncio.wait_for(
+                        self._flush.wait(), self.config.alerts.batch_window_s
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                
+                stop = False
+                while True:
+                    try:
+                        item = self.alert_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+                    if item is None:
+                        stop = True
+                    else:
+                        batch.append(item)
+                
+                await self._deliver_batch(batch)
+            except asyncio.CancelledError:
+                self._resolve(batch, False)
+                raise
+            if stop:
+                return
+    
+    async def _deliver_batch(self, batch: List[tuple]):
+        """Deliver queued alerts, one email per type, and resolve their futures.
+        
+        Args:
+            batch: List of (alert, images, recipients, future) items
+        """
+        # Group by alert type, keeping arrival order
+        groups: Dict[str, list] = {}
+        for item in batch:
+            groups.setdefault(item[0].alert_type, []).append(item)
+        
+        self.processing = True
         try:
-            # Get recipients based on alert level
-            recipients = self._get_recipients(level)
-            if not recipients:
-                self.logger.warning("No alert recipients configured")
-                return False
+            results = await asyncio.gather(
+                *(
+                    self._deliver(
+                        [(alert, images) for alert, images, _, _ in group],
+                        group[0][2]
+                    )
+                    for group in groups.values()
+                ),
+                return_exceptions=True
+            )
+        finally:
+            self.processing = False
+        
+        for group, result in zip(groups.values(), results):
+            self._resolve(group, result is True)
+    
+    @staticmethod
+    def _resolve(items: List[tuple], success: bool):
+        """Complete the futures of queued alert items.
+        
+        Args:
+            items: List of (alert, images, recipients, future) items
+            success: Result reported to the waiting send_alert callers
+        """
+        for _, _, _, future in items:
+            if not future.done():
+                future.set_result(success)
+    
+    async def _deliver(
+        self,
+        batch: List[tuple],
+        recipients: List[str]
+    ) -> bool:
+        """Send one email covering all alerts of a single type.
+        
+        Args:
+            batch: List of (alert, images) pairs of the same alert type
+            recipients: Email recipients
             
+        Returns:
+            True if the email was sent successfully
+        """
+        alerts = [alert for alert, _ in batch]
+        lead = max(alerts, key=lambda a: _LEVEL_RANK.get(a.level, 0))
+        alert_type = lead.alert_type
+        
+        try:
             # Prepare email
-            subject = self._format_subject(alert)
-            body = self._format_body(alert)
+            subject = self._format_subject(lead)
+            if len(alerts) > 1:
+                subject += f" ({len(alerts)} alerts)"
+            body = "\n\n".join(self._format_body(alert) for alert in alerts)
+            
+            # Merge images, skipping buffers shared between alerts
+            images: Optional[List[bytes]] = None
+            if self.config.alerts.include_images:
+                images = []
+                seen = set()
+                for _, alert_images in batch:
+                    for image in alert_images or ():
+                        if id(image) not in seen:
+                            seen.add(id(image))
+                            images.append(image)
             
             # Send email
             success = await self.email_sender.send_email(
                 recipients=recipients,
                 subject=subject,
                 body=body,
-                attachments=images if self.config.alerts.include_images else None
+                attachments=images or None,
+                timestamp=lead.timestamp
             )
+            sent_at = datetime.now()
+            sent_to = list(recipients)
+            
+            for alert in alerts:
+                if success:
+                    alert.sent = True
+                    alert.sent_time = sent_at
+                    alert.recipients = sent_to
+                else:
+                    alert.error = "Failed to send email"
+                # Store alert
+                self._store_alert(alert)
             
             if success:
-                alert.sent = True
-                alert.sent_time = datetime.now()
-                alert.recipients = recipients
-                
                 # Update cooldown
-                self.cooldowns[alert_type] = datetime.now()
+                expiry = time.monotonic() + self.config.alerts.cooldown_minutes * 60
+                self.cooldowns[alert_type] = sent_at
+                self._cool_until[alert_type] = expiry
+                heapq.heappush(self._cool_heap, (expiry, alert_type))
                 
                 # Update statistics
-                self.alert_counts[alert_type] = self.alert_counts.get(alert_type, 0) + 1
+                self.alert_counts[alert_type] = self.alert_counts.get(alert_type, 0) + len(alerts)
                 
                 # Log audit event
                 log_audit_event(
                     event_type="alert_sent",
                     details={
                         "alert_type": alert_type,
-                        "level": level,
-                        "recipients": len(recipients)
+                        "level": lead.level,
+                        "recipients": len(recipients),
+                        "alerts": len(alerts)
                     }
                 )
-            else:
-                alert.error = "Failed to send email"
-            
-            # Store alert
-            self.alerts.append(alert)
             
             return success
             
         except Exception as e:
             self.logger.error(f"Failed to send alert: {e}")
-            alert.error = str(e)
-            self.alerts.append(alert)
+            for alert in alerts:
+                alert.error = str(e)
+                self._store_alert(alert)
             return False
     
     def _check_cooldown(self, alert_type: str) -> bool:
@@ -315,14 +724,21 @@ class AlertManager:
         Returns:
             True if alert can be sent
         """
-        last_sent = self.cooldowns.get(alert_type)
-        if not last_sent:
-            return True
-        
-        cooldown_delta = timedelta(minutes=self.config.alerts.cooldown_minutes)
-        return datetime.now() - last_sent >= cooldown_delta
+        self._expire_cooldowns()
+        return alert_type not in self._cool_until
     
-    def _get_recipients(self, level: str) -> List[str]:
+    def _expire_cooldowns(self):
+        """Drop cooldowns whose expiry has passed."""
+        heap = self._cool_heap
+        now = time.monotonic()
+        while heap and heap[0][0] <= now:
+            expiry, alert_type = heapq.heappop(heap)
+            # Skip stale entries superseded by a later send of the same type
+            if self._cool_until.get(alert_type) == expiry:
+                del self._cool_until[alert_type]
+                del self.cooldowns[alert_type]
+    
+    def _get_recipients(self, level: str) -> Tuple[str, ...]:
         """Get recipients based on alert level.
         
         Args:
@@ -333,7 +749,7 @@ class AlertManager:
         """
         # For now, return all configured recipients
         # Could be extended to have different recipients per level
-        return self.config.alerts.recipients
+        return self._recipients
     
     def _format_subject(self, alert: Alert) -> str:
         """Format email subject.
@@ -344,15 +760,7 @@ class AlertManager:
         Returns:
             Formatted subject
         """
-        # 根據警報等級設定主旨前綴
-        level_prefix = {
-            AlertLevel.INFO: "[INFO]",
-            AlertLevel.WARNING: "[WARNING]",
-            AlertLevel.ERROR: "[ERROR]",
-            AlertLevel.CRITICAL: "[CRITICAL]"
-        }
-        
-        prefix = level_prefix.get(alert.level, "[ALERT]")
+        prefix = _LEVEL_PREFIX.get(alert.level, "[ALERT]")
         return f"{prefix} NCCU Monitor - {alert.alert_type}"
     
     def _format_body(self, alert: Alert) -> str:
@@ -364,40 +772,120 @@ class AlertManager:
         Returns:
             Formatted body
         """
-        body = f"""
-NCCU Server Room Monitoring System Alert
-{'=' * 50}
-
-Alert Type: {alert.alert_type}
-Severity: {alert.level.upper()}
-Time: {alert.timestamp.strftime('%Y-%m-%d %H:%M:%S')}
-Source: {alert.source}
-
-Message:
-{alert.message}
-
-{'=' * 50}
-Location: NCCU Building 1F Server Room
-System: Monitoring System v2.0
-
-Action Required: Please investigate this alert immediately.
-
-Contact:
-- IT Department: (02) 2939-3091
-- Emergency: 0958-242-580
-
-{'=' * 50}
-This is an automated message from the NCCU monitoring system.
-        """
+        body = _BODY_TEMPLATE.substitute(
+            alert_type=alert.alert_type,
+            level=alert.level.upper(),
+            time=alert.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            source=alert.source,
+            message=alert.message
+        )
         
         # Add metadata if present
         if alert.metadata:
-            body += "\n\nAdditional Information:\n"
+            lines = [body, "\n\nAdditional Information:\n"]
             for key, value in alert.metadata.items():
-                body += f"  {key}: {value}\n"
+                lines.append(f"  {key}: {value}\n")
+            body = "".join(lines)
         
         return body.strip()
     
+    async def aclose(self):
+        """Deliver queued alerts, then release resources.
+        
+        The pending batch is sent immediately instead of waiting out the
+        batch window. SMTP threads are joined off the event loop.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        
+        task = self._batch_task
+        if task is not None and not task.done():
+            self._flush.set()
+            await self.alert_queue.put(None)
+            await task
+        
+        await asyncio.get_running_loop().run_in_executor(None, self._release)
+    
+    def close(self):
+        """Release resources without blocking the caller.
+        
+        Safe to call from any thread. Alerts still queued or waiting in the
+        batch window are reported as failed to their callers; use
+        :meth:`aclose` from the event loop to deliver them first. Sends
+        already running finish on the SMTP threads, which close the
+        sessions last.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                self._abort_pending()
+            else:
+                loop.call_soon_threadsafe(self._abort_pending)
+        
+        self._smtp_executor.submit(self.email_sender.close)
+        self._smtp_executor.shutdown(wait=False)
+    
+    def _abort_pending(self):
+        """Stop the batch worker and fail every alert still queued."""
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+        
+        dropped = []
+        while True:
+            try:
+                item = self.alert_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is not None:
+                dropped.append(item)
+        if dropped:
+            self.logger.warning(f"Dropped {len(dropped)} queued alerts on close")
+            self._resolve(dropped, False)
+    
+    def _release(self):
+        """Join the SMTP threads and close the sessions."""
+        self._smtp_executor.shutdown(wait=True)
+        self.email_sender.close()
+    
+    def _store_alert(self, alert: Alert):
+        """Insert an alert into the history, evicting the oldest when full.
+        
+        Concurrent deliveries can finish out of order, so the alert is
+        inserted at its timestamp position to keep the history sorted.
+        
+        Args:
+            alert: Alert to store
+        """
+        alerts = self.alerts
+        if len(alerts) == alerts.maxlen:
+            self._forget_alert(alerts.popleft())
+        index = len(alerts)
+        while index and alerts[index - 1].timestamp > alert.timestamp:
+            index -= 1
+        alerts.insert(index, alert)
+        self._sent_count += alert.sent
+        self._level_counts[alert.level] += 1
+    
+    def _forget_alert(self, alert: Alert):
+        """Remove an evicted alert from the running counters.
+        
+        Args:
+            alert: Alert removed from the history
+        """
+        self._sent_count -= alert.sent
+        self._level_counts[alert.level] -= 1
+        if not self._level_counts[alert.level]:
+            del self._level_counts[alert.level]
+    
     def get_alert_history(
         self,
         limit: Optional[int] = None,
@@ -414,20 +902,18 @@ This is an automated message from the NCCU monitoring system.
         Returns:
             List of alert dictionaries
         """
-        alerts = self.alerts
+        # History is kept in timestamp order, so newest first is a reverse walk
+        alerts = reversed(self.alerts)
         
         # Apply filters
         if alert_type:
-            alerts = [a for a in alerts if a.alert_type == alert_type]
+            alerts = (a for a in alerts if a.alert_type == alert_type)
         if level:
-            alerts = [a for a in alerts if a.level == level]
-        
-        # Sort by timestamp (newest first)
-        alerts.sort(key=lambda a: a.timestamp, reverse=True)
+            alerts = (a for a in alerts if a.level == level)
         
         # Apply limit
         if limit:
-            alerts = alerts[:limit]
+            alerts = itertools.islice(alerts, limit)
         
         return [alert.to_dict() for alert in alerts]
     
@@ -437,21 +923,25 @@ This is an automated message from the NCCU monitoring system.
         Returns:
             Dictionary of statistics
         """
+        self._expire_cooldowns()
+        
         total_alerts = len(self.alerts)
-        sent_alerts = sum(1 for a in self.alerts if a.sent)
+        sent_alerts = self._sent_count
         failed_alerts = total_alerts - sent_alerts
         
         # Count by level
-        level_counts = {}
-        for alert in self.alerts:
-            level_counts[alert.level] = level_counts.get(alert.level, 0) + 1
+        level_counts = dict(self._level_counts)
         
         # Count by type
         type_counts = dict(self.alert_counts)
         
-        # Recent alerts (last 24 hours)
+        # Recent alerts (last 24 hours), counted back from the newest
         recent_cutoff = datetime.now() - timedelta(hours=24)
-        recent_alerts = sum(1 for a in self.alerts if a.timestamp >= recent_cutoff)
+        recent_alerts = 0
+        for alert in reversed(self.alerts):
+            if alert.timestamp < recent_cutoff:
+                break
+            recent_alerts += 1
         
         return {
             "total_alerts": total_alerts,
@@ -460,6 +950,7 @@ This is an automated message from the NCCU monitoring system.
             "recent_alerts_24h": recent_alerts,
             "alerts_by_level": level_counts,
             "alerts_by_type": type_counts,
+            "throttled_by_type": dict(self._throttled_counts),
             "cooldowns": {
                 k: v.isoformat() for k, v in self.cooldowns.items()
             }
@@ -472,14 +963,12 @@ This is an automated message from the NCCU monitoring system.
             days: Number of days to keep
         """
         cutoff = datetime.now() - timedelta(days=days)
-        original_count = len(self.alerts)
+        removed = 0
         
-        self.alerts = [
-            alert for alert in self.alerts
-            if alert.timestamp >= cutoff
-        ]
+        while self.alerts and self.alerts[0].timestamp < cutoff:
+            self._forget_alert(self.alerts.popleft())
+            removed += 1
         
-        removed = original_count - len(self.alerts)
         if removed > 0:
             self.logger.info(f"Cleared {removed} old alerts")
     
@@ -491,8 +980,17 @@ This is an automated message from the NCCU monitoring system.
         """
         alerts_data = [alert.to_dict() for alert in self.alerts]
         
+        if orjson is not None:
+            payload = orjson.dumps(
+                alerts_data,
+                default=str,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+            )
+        else:
+            payload = json.dumps(alerts_data, indent=2, default=str).encode()
+        
         filepath.parent.mkdir(parents=True, exist_ok=True)
-        with open(filepath, "w") as f:
-            json.dump(alerts_data, f, indent=2, default=str)
+        with open(filepath, "wb") as f:
+            f.write(payload)
         
         self.logger.info(f"Exported {len(alerts_data)} alerts to {filepath}")
\ No newline at end of file
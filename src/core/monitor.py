@@ -93,6 +93,8 @@ class MonitorSystem:
         # Threading
         self.monitor_thread: Optional[threading.Thread] = None
         self.alert_queue: asyncio.Queue = asyncio.Queue()
+        self._alert_tasks: Set[asyncio.Task] = set()
+        self._close_task: Optional[asyncio.Task] = None
         
         self._setup_signal_handlers()
         self._initialize_sensors()
@@ -178,6 +180,17 @@ class MonitorSystem:
         # Wait for threads to finish
         if self.monitor_thread:
             self.monitor_thread.join(timeout=5)
+        
+        # Flush queued alerts when stopped from the event loop; from any
+        # other thread, close without blocking on the SMTP threads
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            self._close_task = loop.create_task(self.alert_manager.aclose())
+        else:
+            self.alert_manager.close()
             
         self.logger.info("Monitor system stopped")
         
@@ -280,28 +293,43 @@ class MonitorSystem:
                     timeout=1.0
                 )
                 
-                # Get camera images for alert
-                images = self.camera_manager.get_buffer_images()
-                
-                # Send alert
-                success = await self.alert_manager.send_alert(
-                    alert_type=alert_data["sensor_type"],
-                    message=self._format_alert_message(alert_data),
-                    images=images,
-                    metadata=alert_data
-                )
-                
-                if success:
-                    self.alert_history.append(alert_data)
-                    self.logger.info(f"Alert sent successfully for {alert_data['sensor_name']}")
-                else:
-                    self.logger.error(f"Failed to send alert for {alert_data['sensor_name']}")
+                # Send without blocking the queue so bursts can be batched
+                task = asyncio.create_task(self._send_alert(alert_data))
+                self._alert_tasks.add(task)
+                task.add_done_callback(self._alert_tasks.discard)
                     
             except asyncio.TimeoutError:
                 continue
             except Exception as e:
                 self.logger.error(f"Error processing alert: {e}")
     
+    async def _send_alert(self, alert_data: Dict[str, Any]):
+        """Send a single queued alert with the current camera buffer.
+        
+        Args:
+            alert_data: Alert information
+        """
+        try:
+            # Get camera images for alert
+            images = self.camera_manager.get_buffer_images()
+            
+            # Send alert
+            success = await self.alert_manager.send_alert(
+                alert_type=alert_data["sensor_type"],
+                message=self._format_alert_message(alert_data),
+                images=images,
+                metadata=alert_data
+            )
+            
+            if success:
+                self.alert_history.append(alert_data)
+                self.logger.info(f"Alert sent successfully for {alert_data['sensor_name']}")
+            else:
+                self.logger.error(f"Failed to send alert for {alert_data['sensor_name']}")
+                
+        except Exception as e:
+            self.logger.error(f"Error processing alert: {e}")
+    
     def _format_alert_message(self, alert_data: Dict[str, Any]) -> str:
         """Format alert message for notification.
         
@@ -31,6 +31,7 @@ class SMTPConfig(BaseSettings):
     password: SecretStr = Field(..., env="SMTP_PASS")
     use_tls: bool = Field(default=True, env="SMTP_USE_TLS")
     timeout: int = Field(default=30, env="SMTP_TIMEOUT")
+    local_hostname: Optional[str] = Field(default=None, env="SMTP_LOCAL_HOSTNAME")
     
     class Config:
         env_prefix = "SMTP_"
@@ -45,6 +46,11 @@ class AlertConfig(BaseSettings):
     max_retries: int = Field(default=3, env="ALERT_MAX_RETRIES")
     include_images: bool = Field(default=True, env="ALERT_INCLUDE_IMAGES")
     max_image_size_mb: float = Field(default=10.0, env="ALERT_MAX_IMAGE_SIZE")
+    smtp_pool_size: int = Field(default=3, env="ALERT_SMTP_POOL_SIZE")
+    batch_window_s: float = Field(default=2.0, env="ALERT_BATCH_WINDOW")
+    history_size: int = Field(default=1000, env="ALERT_HISTORY_SIZE")
+    rate_limit_per_s: float = Field(default=1.0, env="ALERT_RATE_LIMIT")
+    rate_limit_burst: int = Field(default=5, env="ALERT_RATE_BURST")
     
     @validator("recipients", pre=True)
     def parse_recipients(cls, v):
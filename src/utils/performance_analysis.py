@@ -4,55 +4,229 @@ NCCU 機房監控系統 - 效能分析工具
 分析系統資源使用和效能瓶頸
 """
 
+import io
 import os
+import re
+import sys
 import time
+import atexit
+import fnmatch
 import psutil
 import logging
+from types import SimpleNamespace
+from functools import cached_property
+from contextlib import contextmanager, redirect_stdout
 from datetime import datetime, timedelta
 from pathlib import Path
 import json
+import numpy as np
+
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+    _loads = json.loads
+
+# 優化建議門檻: (指標, 警告門檻, 嚴重門檻, 警告訊息, 嚴重訊息)
+RECOMMENDATION_THRESHOLDS = (
+    ('cpu_percent', 60, 80,
+     "🟡 CPU 使用率偏高，考慮優化影像處理參數",
+     "🔴 CPU 使用率過高，建議增加 CAP_INTERVAL 或降低影像品質"),
+    ('memory_percent', 60, 80,
+     "🟡 記憶體使用率偏高，監控是否有記憶體洩漏",
+     "🔴 記憶體使用率過高，建議減少 BUFFER_SIZE"),
+    ('disk_used_percent', 80, 90,
+     "🟡 磁碟空間偏少，建議啟用自動清理",
+     "🔴 磁碟空間不足，需要立即清理"),
+    ('captures_mb', 200, 500,
+     "🟡 Captures 目錄較大，建議設定自動清理",
+     "🔴 Captures 目錄過大，建議清理舊檔案"),
+)
+# 監控程序記憶體門檻 (MB) 與訊息樣板
+PROCESS_MEMORY_THRESHOLDS = (
+    100, 200,
+    "🟡 程序 {name} 記憶體使用偏高: {memory_mb:.1f} MB",
+    "🔴 程序 {name} 記憶體使用過高: {memory_mb:.1f} MB",
+)
+
+@contextmanager
+def buffered_stdout():
+    """將區塊內的 print 輸出暫存，結束時一次寫出"""
+    buf = io.StringIO()
+    try:
+        with redirect_stdout(buf):
+            yield
+    finally:
+        sys.stdout.write(buf.getvalue())
+        sys.stdout.flush()
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+# 監控程序名稱比對 (不分大小寫，免逐一 lower())
+_NAME_RE = re.compile(r'monitor', re.IGNORECASE).search
+_NAME_RE_BYTES = re.compile(rb'monitor', re.IGNORECASE).search
+# 位元組換算 MB / GB 的倍率
+_INV_MB = 1.0 / (1 << 20)
+_INV_GB = 1.0 / (1 << 30)
+
+class _AnalysisRun:
+    """單次分析所需的資料，每項只在第一次取用時收集一次"""
+    
+    def __init__(self, analyzer):
+        self._analyzer = analyzer
+    
+    @cached_property
+    def system(self):
+        return self._analyzer._system_snapshot()
+    
+    @cached_property
+    def processes(self):
+        return self._analyzer._snapshot_processes()
+    
+    @cached_property
+    def captures(self):
+        return self._analyzer.get_captures_size()
+    
+    @cached_property
+    def reports(self):
+        """最近的歷史記錄，沒有報告檔時為 None"""
+        analyzer = self._analyzer
+        if not analyzer.report_file.exists():
+            return None
+        return analyzer._read_recent_reports(analyzer.TREND_RECORDS)
+    
+    @cached_property
+    def stats(self):
+        return self._analyzer.get_current_stats(self)
 
 class PerformanceAnalyzer:
     """效能分析器"""
     
+    TREND_RECORDS = 10                # 趨勢分析取最近幾筆記錄
+    TAIL_BYTES = 64 * 1024            # 從報告檔尾端讀取的位元組數
+    REPORT_MAX_BYTES = 5 * 1024 * 1024  # 報告檔超過此大小即輪替
+    PROC_SNAPSHOT_TTL = 2.0           # 程序快照有效秒數
+    CPU_SAMPLE_MIN = 0.5              # CPU 使用率最短取樣區間 (秒)
+    
     def __init__(self):
         self.log_dir = Path("logs")
         self.log_dir.mkdir(exist_ok=True)
         self.report_file = self.log_dir / "performance_report.json"
         self.baseline_memory = None
         self.baseline_cpu = None
+        # 監控程序快照: (建立時間, 程序列表)
+        self._proc_snapshot = None
+        # 先取樣一次 CPU，之後以非阻塞方式讀取自此以來的使用率
+        psutil.cpu_percent(interval=None)
+        self._cpu_primed_at = time.monotonic()
+        # 報告檔 append 用的 fd，第一次寫入時開啟並保留
+        self._report_fd = None
         
-    def get_current_stats(self):
-        """取得當前系統統計"""
+    def _scandir_recursive(self, path):
+        """遞迴列出目錄下的檔案 (DirEntry)，沿用 scandir 快取的 stat 結果"""
         try:
-            # 取得程序資訊
-            monitor_processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'memory_info', 'cpu_percent']):
-                if 'monitor' in proc.info['name'].lower():
-                    monitor_processes.append({
-                        'pid': proc.info['pid'],
-                        'name': proc.info['name'],
-                        'memory_mb': proc.info['memory_info'].rss / 1024 / 1024,
-                        'cpu_percent': proc.info['cpu_percent']
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_file(follow_symlinks=False):
+                        yield entry
+                    elif entry.is_dir(follow_symlinks=False):
+                        yield from self._scandir_recursive(entry.path)
+        except PermissionError:
+            return
+        
+    def _snapshot_processes(self):
+        """掃描一次 /proc 取得監控程序，短時間內重複呼叫沿用同一份快照"""
+        now = time.monotonic()
+        cached = self._proc_snapshot
+        if cached is not None and now - cached[0] < self.PROC_SNAPSHOT_TTL:
+            return cached[1]
+        
+        if sys.platform.startswith('linux'):
+            processes = self._fast_proc_scan()
+        else:
+            processes = []
+            for proc in psutil.process_iter(['pid', 'name', 'memory_info']):
+                info = proc.info
+                if info['memory_info'] is None:
+                    continue  # 無權限讀取
+                if _NAME_RE(info['name']):
+                    processes.append({
+                        'pid': info['pid'],
+                        'name': info['name'],
+                        'memory_mb': info['memory_info'].rss * _INV_MB
                     })
+        self._proc_snapshot = (now, processes)
+        return processes
+    
+    def _fast_proc_scan(self):
+        """Linux 快速路徑: 直接讀 /proc/<pid>/comm 與 statm，不經 psutil"""
+        processes = []
+        with os.scandir('/proc') as it:
+            for entry in it:
+                if not entry.name.isdigit():
+                    continue
+                base = entry.path
+                try:
+                    with open(base + '/comm', 'rb') as f:
+                        comm = f.read()
+                    if not _NAME_RE_BYTES(comm):
+                        continue
+                    name = comm.rstrip(b'\n').decode(errors='replace')
+                    with open(base + '/statm', 'rb') as f:
+                        rss_pages = int(f.read().split()[1])
+                except (FileNotFoundError, ProcessLookupError, PermissionError):
+                    continue  # 程序已結束或無權限
+                processes.append({
+                    'pid': int(entry.name),
+                    'name': name,
+                    'memory_mb': rss_pages * _PAGE_SIZE * _INV_MB
+                })
+        return processes
+    
+    def _system_snapshot(self):
+        """每項系統資源各查詢一次，供同一輪分析共用"""
+        # 初始化後取樣區間太短時補足，避免讀到無意義的數值
+        remaining = self.CPU_SAMPLE_MIN - (time.monotonic() - self._cpu_primed_at)
+        if remaining > 0:
+            time.sleep(remaining)
+        return SimpleNamespace(
+            cpu_percent=psutil.cpu_percent(interval=None),
+            memory=psutil.virtual_memory(),
+            disk=psutil.disk_usage('/'),
+            load_average=os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0
+        )
+    
+    def get_current_stats(self, run=None, include_captures=True):
+        """取得當前系統統計 (include_captures=False 時略過 captures 目錄掃描)"""
+        run = run or _AnalysisRun(self)
+        try:
+            # 取得程序資訊
+            monitor_processes = run.processes
             
             # 系統整體資源
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
+            snap = run.system
+            memory = snap.memory
+            disk = snap.disk
             
             stats = {
                 'timestamp': datetime.now().isoformat(),
                 'system': {
-                    'cpu_percent': psutil.cpu_percent(interval=1),
+                    'cpu_percent': snap.cpu_percent,
                     'memory_percent': memory.percent,
-                    'memory_available_mb': memory.available / 1024 / 1024,
-                    'disk_free_gb': disk.free / 1024 / 1024 / 1024,
+                    'memory_available_mb': memory.available * _INV_MB,
+                    'disk_free_gb': disk.free * _INV_GB,
                     'disk_used_percent': (disk.used / disk.total) * 100,
-                    'load_average': os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0
+                    'load_average': snap.load_average
                 },
-                'monitor_processes': monitor_processes,
-                'captures_dir_size': self.get_captures_size()
+                'monitor_processes': monitor_processes
             }
+            if include_captures:
+                stats['captures_dir_size'] = run.captures
             
             return stats
             
@@ -61,64 +235,113 @@ class PerformanceAnalyzer:
             return None
     
     def get_captures_size(self):
-        """取得 captures 目錄大小"""
+        """取得 captures 目錄大小 (每次分析由 _AnalysisRun 快取，只掃描一次)"""
         try:
-            captures_dir = Path("captures")
-            if not captures_dir.exists():
-                return 0
-                
             total_size = 0
             file_count = 0
-            for file_path in captures_dir.rglob('*'):
-                if file_path.is_file():
-                    total_size += file_path.stat().st_size
-                    file_count += 1
+            for entry in self._scandir_recursive("captures"):
+                total_size += entry.stat(follow_symlinks=False).st_size
+                file_count += 1
             
             return {
-                'size_mb': total_size / 1024 / 1024,
+                'size_mb': total_size * _INV_MB,
                 'file_count': file_count
             }
         except Exception:
             return {'size_mb': 0, 'file_count': 0}
     
+    def _read_recent_reports(self, count):
+        """只讀取報告檔尾端，取得最近 count 筆記錄"""
+        with open(self.report_file, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            offset = max(0, size - self.TAIL_BYTES)
+            f.seek(offset)
+            lines = f.read().split(b'\n')
+        if offset > 0:
+            lines = lines[1:]  # 第一行可能不完整
+        return [_loads(line) for line in lines if line.strip()][-count:]
+    
+    def _rotate_report(self):
+        """報告檔過大時輪替為 .1，僅保留一份舊檔"""
+        try:
+            if self._report_fd is not None:
+                size = os.fstat(self._report_fd).st_size
+            else:
+                size = self.report_file.stat().st_size
+            if size >= self.REPORT_MAX_BYTES:
+                self.close()  # 輪替後需重新開啟新檔
+                os.replace(self.report_file, self.report_file.with_suffix('.json.1'))
+        except FileNotFoundError:
+            pass
+    
+    def _open_report(self):
+        """取得報告檔的 append fd (O_APPEND 保證每筆記錄完整寫在檔尾)"""
+        if self._report_fd is None:
+            self._report_fd = os.open(self.report_file,
+                                      os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            atexit.register(self.close)
+        return self._report_fd
+    
+    def close(self):
+        """關閉報告檔 fd"""
+        fd = self._report_fd
+        if fd is not None:
+            self._report_fd = None
+            atexit.unregister(self.close)
+            os.close(fd)
+    
+    def _collect_once(self):
+        """一次收集完整分析所需資料: 程序、系統資源、captures 與歷史記錄各一次"""
+        run = _AnalysisRun(self)
+        run.stats
+        try:
+            run.reports
+        except Exception:
+            pass  # 讀取失敗時由趨勢分析段落回報
+        return run
+    
     def analyze_memory_usage(self):
         """分析記憶體使用情況"""
+        self._print_memory(_AnalysisRun(self))
+    
+    def _print_memory(self, run):
         print("📊 記憶體使用分析")
         print("=" * 50)
         
         try:
             # 系統記憶體
-            memory = psutil.virtual_memory()
+            memory = run.system.memory
             print(f"系統記憶體:")
-            print(f"  總量: {memory.total / 1024 / 1024 / 1024:.1f} GB")
-            print(f"  可用: {memory.available / 1024 / 1024:.0f} MB ({100 - memory.percent:.1f}%)")
-            print(f"  使用: {memory.used / 1024 / 1024:.0f} MB ({memory.percent:.1f}%)")
+            print(f"  總量: {memory.total * _INV_GB:.1f} GB")
+            print(f"  可用: {memory.available * _INV_MB:.0f} MB ({100 - memory.percent:.1f}%)")
+            print(f"  使用: {memory.used * _INV_MB:.0f} MB ({memory.percent:.1f}%)")
             
             # 監控程序記憶體
             print(f"\n監控程序記憶體:")
-            for proc in psutil.process_iter(['pid', 'name', 'memory_info']):
-                if 'monitor' in proc.info['name'].lower():
-                    memory_mb = proc.info['memory_info'].rss / 1024 / 1024
-                    print(f"  {proc.info['name']} (PID: {proc.info['pid']}): {memory_mb:.1f} MB")
+            for proc in run.processes:
+                print(f"  {proc['name']} (PID: {proc['pid']}): {proc['memory_mb']:.1f} MB")
             
         except Exception as e:
             print(f"記憶體分析失敗: {e}")
     
     def analyze_storage_usage(self):
         """分析儲存使用情況"""
+        self._print_storage(_AnalysisRun(self))
+    
+    def _print_storage(self, run):
         print("\n💾 儲存空間分析")
         print("=" * 50)
         
         try:
             # 系統磁碟空間
-            disk = psutil.disk_usage('/')
+            disk = run.system.disk
             print(f"系統磁碟:")
-            print(f"  總量: {disk.total / 1024 / 1024 / 1024:.1f} GB")
-            print(f"  可用: {disk.free / 1024 / 1024 / 1024:.1f} GB")
-            print(f"  使用: {disk.used / 1024 / 1024 / 1024:.1f} GB ({(disk.used/disk.total)*100:.1f}%)")
+            print(f"  總量: {disk.total * _INV_GB:.1f} GB")
+            print(f"  可用: {disk.free * _INV_GB:.1f} GB")
+            print(f"  使用: {disk.used * _INV_GB:.1f} GB ({(disk.used/disk.total)*100:.1f}%)")
             
             # Captures 目錄分析
-            captures_info = self.get_captures_size()
+            captures_info = run.captures
             print(f"\nCaptures 目錄:")
             print(f"  大小: {captures_info['size_mb']:.1f} MB")
             print(f"  檔案數: {captures_info['file_count']}")
@@ -130,14 +353,15 @@ class PerformanceAnalyzer:
             # 日誌檔案分析
             log_size = 0
             log_count = 0
-            log_dir = Path("logs")
-            if log_dir.exists():
-                for log_file in log_dir.glob("*.log*"):
-                    log_size += log_file.stat().st_size
-                    log_count += 1
+            if os.path.isdir("logs"):
+                with os.scandir("logs") as it:
+                    for entry in it:
+                        if fnmatch.fnmatch(entry.name, "*.log*") and entry.is_file():
+                            log_size += entry.stat().st_size
+                            log_count += 1
             
             print(f"\n日誌檔案:")
-            print(f"  大小: {log_size / 1024 / 1024:.1f} MB")
+            print(f"  大小: {log_size * _INV_MB:.1f} MB")
             print(f"  檔案數: {log_count}")
             
         except Exception as e:
@@ -145,38 +369,47 @@ class PerformanceAnalyzer:
     
     def analyze_performance_trends(self):
         """分析效能趨勢"""
+        self._print_trends(_AnalysisRun(self))
+    
+    def _print_trends(self, run):
         print("\n📈 效能趨勢分析")
         print("=" * 50)
         
         try:
-            if not self.report_file.exists():
+            reports = run.reports
+            if reports is None:
                 print("沒有歷史效能資料")
                 return
             
-            with open(self.report_file, 'r') as f:
-                reports = [json.loads(line) for line in f.readlines()[-10:]]  # 最近 10 筆記錄
-            
             if not reports:
                 print("沒有有效的效能資料")
                 return
             
+            # 每筆記錄一列: CPU、記憶體、captures 大小
+            values = np.fromiter(
+                ((r['system']['cpu_percent'],
+                  r['system']['memory_percent'],
+                  r.get('captures_dir_size', {}).get('size_mb', 0)) for r in reports),
+                dtype=(np.float32, 3), count=len(reports))
+            means = values.mean(axis=0)
+            highs = values.max(axis=0)
+            lows = values.min(axis=0)
+            
             # CPU 趨勢
-            cpu_values = [r['system']['cpu_percent'] for r in reports]
             print(f"CPU 使用率趨勢:")
-            print(f"  平均: {sum(cpu_values) / len(cpu_values):.1f}%")
-            print(f"  最高: {max(cpu_values):.1f}%")
-            print(f"  最低: {min(cpu_values):.1f}%")
+            print(f"  平均: {means[0]:.1f}%")
+            print(f"  最高: {highs[0]:.1f}%")
+            print(f"  最低: {lows[0]:.1f}%")
             
             # 記憶體趨勢
-            memory_values = [r['system']['memory_percent'] for r in reports]
             print(f"\n記憶體使用率趨勢:")
-            print(f"  平均: {sum(memory_values) / len(memory_values):.1f}%")
-            print(f"  最高: {max(memory_values):.1f}%")
-            print(f"  最低: {min(memory_values):.1f}%")
+            print(f"  平均: {means[1]:.1f}%")
+            print(f"  最高: {highs[1]:.1f}%")
+            print(f"  最低: {lows[1]:.1f}%")
             
             # 儲存空間趨勢
             if 'captures_dir_size' in reports[-1]:
-                storage_values = [r.get('captures_dir_size', {}).get('size_mb', 0) for r in reports]
+                storage_values = values[:, 2]
                 storage_growth = storage_values[-1] - storage_values[0] if len(storage_values) > 1 else 0
                 print(f"\nCaptures 儲存空間:")
                 print(f"  當前: {storage_values[-1]:.1f} MB")
@@ -191,48 +424,35 @@ class PerformanceAnalyzer:
     
     def generate_optimization_recommendations(self):
         """產生優化建議"""
+        self._print_recommendations(_AnalysisRun(self))
+    
+    def _print_recommendations(self, run):
         print("\n💡 優化建議")
         print("=" * 50)
         
         try:
-            stats = self.get_current_stats()
+            stats = run.stats
             if not stats:
                 print("無法取得系統資訊")
                 return
             
             recommendations = []
             
-            # CPU 使用率建議
-            if stats['system']['cpu_percent'] > 80:
-                recommendations.append("🔴 CPU 使用率過高，建議增加 CAP_INTERVAL 或降低影像品質")
-            elif stats['system']['cpu_percent'] > 60:
-                recommendations.append("🟡 CPU 使用率偏高，考慮優化影像處理參數")
-            
-            # 記憶體使用建議
-            if stats['system']['memory_percent'] > 80:
-                recommendations.append("🔴 記憶體使用率過高，建議減少 BUFFER_SIZE")
-            elif stats['system']['memory_percent'] > 60:
-                recommendations.append("🟡 記憶體使用率偏高，監控是否有記憶體洩漏")
-            
-            # 儲存空間建議
-            if stats['system']['disk_used_percent'] > 90:
-                recommendations.append("🔴 磁碟空間不足，需要立即清理")
-            elif stats['system']['disk_used_percent'] > 80:
-                recommendations.append("🟡 磁碟空間偏少，建議啟用自動清理")
-            
-            # Captures 目錄大小建議
+            # 依門檻表判斷: 0 = 正常, 1 = 警告, 2 = 嚴重
             captures_size = stats['captures_dir_size']['size_mb']
-            if captures_size > 500:
-                recommendations.append("🔴 Captures 目錄過大，建議清理舊檔案")
-            elif captures_size > 200:
-                recommendations.append("🟡 Captures 目錄較大，建議設定自動清理")
+            metrics = dict(stats['system'], captures_mb=captures_size)
+            for key, warn, crit, warn_msg, crit_msg in RECOMMENDATION_THRESHOLDS:
+                value = metrics[key]
+                level = (value > warn) + (value > crit)
+                if level:
+                    recommendations.append((None, warn_msg, crit_msg)[level])
             
             # 監控程序建議
+            warn, crit, warn_msg, crit_msg = PROCESS_MEMORY_THRESHOLDS
             for proc in stats['monitor_processes']:
-                if proc['memory_mb'] > 200:
-                    recommendations.append(f"🔴 程序 {proc['name']} 記憶體使用過高: {proc['memory_mb']:.1f} MB")
-                elif proc['memory_mb'] > 100:
-                    recommendations.append(f"🟡 程序 {proc['name']} 記憶體使用偏高: {proc['memory_mb']:.1f} MB")
+                level = (proc['memory_mb'] > warn) + (proc['memory_mb'] > crit)
+                if level:
+                    recommendations.append((None, warn_msg, crit_msg)[level].format(**proc))
             
             if recommendations:
                 for rec in recommendations:
@@ -257,13 +477,15 @@ class PerformanceAnalyzer:
         except Exception as e:
             print(f"優化建議產生失敗: {e}")
     
-    def save_performance_report(self):
+    def save_performance_report(self, include_captures=True):
         """保存效能報告"""
+        self._append_report(self.get_current_stats(include_captures=include_captures))
+    
+    def _append_report(self, stats):
         try:
-            stats = self.get_current_stats()
             if stats:
-                with open(self.report_file, 'a') as f:
-                    f.write(json.dumps(stats) + '\n')
+                self._rotate_report()
+                os.write(self._open_report(), _dumps(stats) + b'\n')
                 print(f"效能報告已保存到 {self.report_file}")
         except Exception as e:
             print(f"保存效能報告失敗: {e}")
@@ -274,11 +496,12 @@ class PerformanceAnalyzer:
         print("=" * 60)
         print(f"分析時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
-        self.analyze_memory_usage()
-        self.analyze_storage_usage()
-        self.analyze_performance_trends()
-        self.generate_optimization_recommendations()
-        self.save_performance_report()
+        run = self._collect_once()
+        self._print_memory(run)
+        self._print_storage(run)
+        self._print_trends(run)
+        self._print_recommendations(run)
+        self._append_report(run.stats)
         
         print("\n" + "=" * 60)
         print("分析完成！建議定期執行此分析以監控系統效能。")
@@ -293,23 +516,26 @@ def main():
     parser.add_argument("--trends", action="store_true", help="只分析效能趨勢")
     parser.add_argument("--recommendations", action="store_true", help="只產生優化建議")
     parser.add_argument("--save", action="store_true", help="只保存當前統計")
+    parser.add_argument("--no-captures", action="store_true",
+                        help="保存統計時不掃描 captures 目錄 (搭配 --save)")
     
     args = parser.parse_args()
     
     analyzer = PerformanceAnalyzer()
     
-    if args.memory:
-        analyzer.analyze_memory_usage()
-    elif args.storage:
-        analyzer.analyze_storage_usage()
-    elif args.trends:
-        analyzer.analyze_performance_trends()
-    elif args.recommendations:
-        analyzer.generate_optimization_recommendations()
-    elif args.save:
-        analyzer.save_performance_report()
-    else:
-        analyzer.run_full_analysis()
+    with buffered_stdout():
+        if args.memory:
+            analyzer.analyze_memory_usage()
+        elif args.storage:
+            analyzer.analyze_storage_usage()
+        elif args.trends:
+            analyzer.analyze_performance_trends()
+        elif args.recommendations:
+            analyzer.generate_optimization_recommendations()
+        elif args.save:
+            analyzer.save_performance_report(include_captures=not args.no_captures)
+        else:
+            analyzer.run_full_analysis()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,23 @@
 #!/usr/bin/env python3
-import board
-import digitalio
 import time
 
+import gpiod
+from gpiod.line import Bias, Direction, Value
+
+GPIO_CHIP = "/dev/gpiochip0"
+
+
+def scan_levels(pins, bias):
+    """以單一 bulk request 設定偏壓並讀取整組腳位電位"""
+    settings = gpiod.LineSettings(direction=Direction.INPUT, bias=bias)
+    request = gpiod.request_lines(GPIO_CHIP, consumer="sensor-scan", config={tuple(pins): settings})
+    try:
+        time.sleep(0.01)  # 等待電位穩定
+        values = request.get_values(pins)
+    finally:
+        request.release()
+    return {pin: value == Value.ACTIVE for pin, value in zip(pins, values)}
+
 print("綜合感測器檢測報告")
 print("=" * 50)
 
@@ -18,31 +33,17 @@ results = {}
 print("\n1. 檢測所有 GPIO 腳位狀態...")
 print("-" * 50)
 
-all_gpio = [
-    (board.D2, 2), (board.D3, 3), (board.D4, 4), (board.D5, 5),
-    (board.D6, 6), (board.D7, 7), (board.D8, 8), (board.D9, 9),
-    (board.D10, 10), (board.D11, 11), (board.D12, 12), (board.D13, 13),
-    (board.D14, 14), (board.D15, 15), (board.D16, 16), (board.D17, 17),
-    (board.D18, 18), (board.D19, 19), (board.D20, 20), (board.D21, 21),
-    (board.D22, 22), (board.D23, 23), (board.D24, 24), (board.D25, 25),
-    (board.D26, 26), (board.D27, 27)
-]
+all_gpio = list(range(2, 28))
 
-for pin, num in all_gpio:
-    try:
-        # 測試上拉
-        sensor = digitalio.DigitalInOut(pin)
-        sensor.direction = digitalio.Direction.INPUT
-        sensor.pull = digitalio.Pull.UP
-        up_value = sensor.value
-        sensor.deinit()
-        
-        # 測試下拉
-        sensor = digitalio.DigitalInOut(pin)
-        sensor.direction = digitalio.Direction.INPUT
-        sensor.pull = digitalio.Pull.DOWN
-        down_value = sensor.value
-        sensor.deinit()
+try:
+    # 感測器腳位可能已被監控服務占用，直接標示為已使用，不納入掃描
+    scan_gpio = [num for num in all_gpio if num not in [17, 27]]
+    up_levels = scan_levels(scan_gpio, Bias.PULL_UP)
+    down_levels = scan_levels(scan_gpio, Bias.PULL_DOWN)
+    
+    for num in all_gpio:
+        up_value = up_levels.get(num, False)
+        down_value = down_levels.get(num, False)
         
         # 判斷狀態
         if num in [17, 27]:
@@ -62,7 +63,8 @@ for pin, num in all_gpio:
         if "可能有感測器" in status or "強制低電位" in status:
             print(f"GPIO {num:2d}: {status}")
             
-    except Exception as e:
+except Exception as e:
+    for num in all_gpio:
         results[num] = (None, None, f"錯誤: {e}")
 
 print("\n2. 可能的感測器配置推理...")
@@ -0,0 +1,75 @@
+"""
+legacy/monitor_daemon.py 影格池測試
+靜止畫面下，緩衝區中的影格不得被擷取執行緒覆寫
+"""
+
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+DAEMON_PATH = Path(__file__).resolve().parents[2] / "legacy" / "monitor_daemon.py"
+
+
+@pytest.fixture(scope="module")
+def daemon():
+    cwd = os.getcwd()
+    try:
+        spec = importlib.util.spec_from_file_location("monitor_daemon", DAEMON_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)  # 模組載入時會切換到 legacy/ 目錄
+    return module
+
+
+def make_monitor(daemon, buffer_size=3, shape=(4, 4, 3)):
+    from collections import deque
+
+    monitor = daemon.MonitorSystem()
+    monitor.np = np
+    monitor.BUFFER_SIZE = buffer_size
+    monitor.MOTION_THRESHOLD = 2.0
+    monitor.frame_pool = daemon.FramePool(np, shape, buffer_size + 4)
+    monitor.buffer = deque(maxlen=buffer_size)
+    monitor._diff_buf = np.empty(shape, dtype=np.int16)
+    monitor._prev_roi = np.zeros(shape, dtype=np.uint8)
+    return monitor
+
+
+def capture(monitor, value, ts):
+    """模擬擷取執行緒：取得槽位、寫入畫面並送入影格佇列"""
+    index, roi = monitor.frame_pool.acquire()
+    roi[...] = value
+    monitor.frame_queue.put((ts, (index, roi)))
+    monitor._drain_frames(False, False)
+
+
+def test_buffered_frame_survives_static_scene(daemon):
+    monitor = make_monitor(daemon)
+    capture(monitor, 200, "t0")
+    assert len(monitor.buffer) == 1
+
+    # 畫面靜止：後續影格都被略過，但必須寫入其他槽位
+    captures = (monitor.BUFFER_SIZE + 4) * 3
+    for i in range(captures):
+        capture(monitor, 201, f"t{i + 1}")
+
+    assert len(monitor.buffer) == 1
+    entry = monitor.buffer[0]
+    assert entry["ts"] == "t0"
+    assert (entry["img"] == 200).all()
+
+
+def test_evicted_frame_slot_is_released(daemon):
+    monitor = make_monitor(daemon)
+    for i in range(monitor.BUFFER_SIZE * 4):
+        capture(monitor, (i * 50) % 256, f"t{i}")
+
+    pinned = [i for i, count in enumerate(monitor.frame_pool.refcounts) if count]
+    assert sorted(pinned) == sorted(e["slot"] for e in monitor.buffer)
+    for e in monitor.buffer:
+        assert (e["img"] == int(e["ts"][1:]) * 50 % 256).all()